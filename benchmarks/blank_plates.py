@@ -0,0 +1,99 @@
+"""Regression check: experiments with blank plates give the same numbers as dropping those plates.
+
+A plate-count export can have blank plate cells (plates not counted yet);
+the loader keeps them as NaN rows. The statistics must treat them as
+missing, exactly as if the rows were not there, the way the groupby of the
+original scripts skipped NaN. This blanks a few plates of a CSV and
+compares each affected stage with a run on the frame without those rows.
+
+    python benchmarks/blank_plates.py ["cfu count thesis.csv"]
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cfu.pipeline import (build_cube, estimate_efficacy, load_data, render_section,  # noqa: E402
+                          run_permutation_anova, summarize)
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cfu count thesis.csv')
+# (sample row, plate column) of the plates blanked out
+BLANKS = ((0, '2'), (20, '5'))
+
+
+def blank_csv(csv_path, out_path, blanks=BLANKS):
+    """Copy of the CSV with the given plates (and their rows' averages) left empty."""
+    wide = pd.read_csv(csv_path, index_col=0, dtype=str, keep_default_na=False)
+    for row, plate in blanks:
+        wide.iloc[row, wide.columns.get_loc(plate)] = ''
+        if 'average' in wide.columns:
+            wide.iloc[row, wide.columns.get_loc('average')] = ''
+    wide.to_csv(out_path, index_label='')
+    return out_path
+
+
+def check_summary(tidy, complete):
+    """Summary table of the frame with blank rows against the frame without them."""
+    pd.testing.assert_frame_equal(summarize(build_cube(tidy)), summarize(build_cube(complete)))
+    summary = summarize(build_cube(tidy))
+    if summary.drop(columns='efficacy').isna().any().any():
+        raise AssertionError('NaN cell statistics with blank plates')
+
+
+def check_efficacy(tidy, complete):
+    """Bootstrap efficacy intervals: blank plates must not be drawn into any resample."""
+    with_blanks = estimate_efficacy(tidy, n_resamples=2000, workers=1)
+    without = estimate_efficacy(complete, n_resamples=2000, workers=1)
+    for key in ('by_position', 'overall'):
+        pd.testing.assert_frame_equal(with_blanks[key], without[key])
+        if with_blanks[key][['ci_low', 'ci_high']].isna().any().any():
+            raise AssertionError(f'NaN {key} efficacy interval with blank plates')
+
+
+def check_permutation(tidy, complete):
+    """Permutation ANOVA: runs with single blank plates, is skipped with the reason when a whole replicate is."""
+    if isinstance(run_permutation_anova(build_cube(tidy), max_permutations=1000, workers=1), dict):
+        raise AssertionError('permutation test skipped for single blank plates')
+    first = tidy.iloc[0]
+    whole = (tidy[['Treatment', 'Position', 'Replicate']] == first[['Treatment', 'Position', 'Replicate']]).all(axis=1)
+    skipped = run_permutation_anova(build_cube(tidy.assign(CFU=tidy['CFU'].mask(whole))), workers=1)
+    expected = f"{first['Treatment']} at {first['Position']}, replicate {first['Replicate']}"
+    if not isinstance(skipped, dict) or expected not in skipped['skipped']:
+        raise AssertionError(f'skip reason does not name {expected}: {skipped}')
+    text = render_section('permutation', ['permutation'], skipped)['markdown']
+    if skipped['skipped'] not in text:
+        raise AssertionError('skip reason missing from the report section')
+
+
+CHECKS = {'summary': check_summary, 'efficacy': check_efficacy, 'permutation': check_permutation}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    csv_path = argv[0] if argv else DEFAULT_CSV
+    with tempfile.TemporaryDirectory() as workdir:
+        tidy = load_data(blank_csv(csv_path, os.path.join(workdir, 'blank.csv')))
+    blank = int(tidy['CFU'].isna().sum())
+    if blank != len(BLANKS):
+        raise AssertionError(f'expected {len(BLANKS)} blank plates, the loader kept {blank}')
+    complete = tidy[tidy['CFU'].notna()].reset_index(drop=True)
+
+    failed = 0
+    for name, check in CHECKS.items():
+        try:
+            check(tidy, complete)
+        except AssertionError as exc:
+            failed += 1
+            print(f"FAIL {name}: {exc}")
+        else:
+            print(f"ok   {name}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Memory and groupby benchmark of the tidy frame representation.
+
+Generates a large synthetic export (cfu.synthetic), loads it with load_data
+and compares the result with the string/int64 layout the loader used to
+produce: object string Position/Treatment columns, a concatenated
+Treatment_Position column and 64-bit integer counts.
+
+    python benchmarks/memory.py --replicates 50000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cfu.pipeline import load_data  # noqa: E402
+from cfu.synthetic import generate_counts, write_csv  # noqa: E402
+
+
+def legacy_frame(tidy):
+    """The tidy frame as the loader used to build it: string labels and int64 numbers."""
+    legacy = pd.DataFrame({
+        'Position': np.asarray(tidy['Position'], dtype=object),
+        'Treatment': np.asarray(tidy['Treatment'], dtype=object),
+        'Replicate': tidy['Replicate'].to_numpy(dtype=np.int64),
+        'Measurement': tidy['Measurement'].to_numpy(dtype=np.int64),
+        'CFU': tidy['CFU'].to_numpy(dtype=np.int64),
+    })
+    legacy['Treatment_Position'] = legacy['Treatment'] + '_' + legacy['Position']
+    return legacy
+
+
+def groupby_seconds(frame, repeat=3):
+    """Best-of-repeat time of the summary groupby on Treatment x Position."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame.groupby(['Treatment', 'Position'], observed=True)['CFU'].agg(['count', 'mean', 'std'])
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replicates', type=int, default=20_000,
+                        help='replicates per Treatment x Position cell (5 plates each)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_csv(generate_counts(n_replicates=args.replicates), os.path.join(tmp, 'counts.csv'))
+        start = time.perf_counter()
+        compact = load_data(path)
+        load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    legacy = legacy_frame(compact)
+    legacy_seconds = time.perf_counter() - start
+
+    rows = []
+    for name, frame in (('legacy', legacy), ('compact', compact)):
+        usage = frame.memory_usage(deep=True)
+        rows.append({
+            'layout': name,
+            'MB': usage.sum() / 1e6,
+            'bytes/plate': usage.sum() / len(frame),
+            'groupby s': groupby_seconds(frame),
+        })
+    result = pd.DataFrame(rows).set_index('layout')
+    print(f"{len(compact):,} plates; load_data {load_seconds:.2f} s, "
+          f"legacy string columns {legacy_seconds:.2f} s to build")
+    print(result.round(3).to_string())
+    print(f"memory reduction: {result.at['legacy', 'MB'] / result.at['compact', 'MB']:.1f}x")
+    print("\nper column (bytes):")
+    print(pd.DataFrame({name: frame.memory_usage(deep=True, index=False)
+                        for name, frame in (('legacy', legacy), ('compact', compact))}).to_string())
+
+
+if __name__ == '__main__':
+    main()
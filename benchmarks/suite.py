@@ -0,0 +1,132 @@
+"""Scaling benchmark of every pipeline stage on synthetic experiments.
+
+For each design in a grid (treatments x positions x replicates x plates per
+replicate) a synthetic CSV is generated and the full report is built
+without a cache under the stage profiler; designs with more than the three
+thesis treatments or positions are loaded with cfu.synthetic.label_maps. That gives the time of loading,
+the summary statistics, each statistical stage, each figure and the report.
+Each stage's time is then fitted against the number of plates on log-log
+axes over the larger half of the grid (where fixed costs matter least), and
+stages whose exponent is clearly above 1 are flagged as growing worse than
+linearly.
+
+    python benchmarks/suite.py --replicates 3 30 300 --plates 5 20 --treatments 3 6
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cfu.cache import ArtifactCache  # noqa: E402
+from cfu.pipeline import build_stages, build_targets  # noqa: E402
+from cfu.profiling import Profiler  # noqa: E402
+from cfu.synthetic import generate_counts, label_maps, write_csv  # noqa: E402
+
+TREATMENTS = (3,)
+POSITIONS = (3,)
+REPLICATES = (3, 30, 300)
+PLATES = (5, 20)
+SLOPE_LIMIT = 1.2  # log-log exponent above which a stage counts as superlinear
+MIN_SECONDS = 0.005  # timings below this are too noisy to fit
+
+
+def span_label(name):
+    """Span name without the run directory: 'figure:/tmp/x/a.png' -> 'figure:a.png'."""
+    kind, _, path = name.partition(':')
+    return f'{kind}:{os.path.basename(path)}' if path else kind
+
+
+def run_design(n_treatments, n_positions, n_replicates, n_plates, workdir, n_resamples, n_permutations, seed=0):
+    """Build the full report for one synthetic design; returns {stage: seconds}."""
+    outdir = os.path.join(workdir, f't{n_treatments}_s{n_positions}_r{n_replicates}_p{n_plates}')
+    os.makedirs(outdir, exist_ok=True)
+    csv_path = write_csv(generate_counts(n_treatments, n_positions, n_replicates, n_plates, seed=seed),
+                         os.path.join(outdir, 'counts.csv'))
+    position_map, treatment_map = label_maps(n_treatments, n_positions)
+    profiler = Profiler()
+    stages = build_stages(csv_path, outdir, ArtifactCache(None, profiler=profiler),
+                          n_resamples=n_resamples, seed=seed, workers=1,
+                          max_permutations=n_permutations, position_map=position_map,
+                          treatment_map=treatment_map)
+    build_targets(stages, ['report'], workers=1)
+    return {span_label(record['name']): record['wall_seconds'] for record in profiler.records}
+
+
+def scaling_exponents(timings, plates):
+    """Slope of log(seconds) on log(plates) per stage over the larger half of the sizes.
+
+    Timings under MIN_SECONDS are dropped as noise; stages with fewer than
+    two usable sizes get NaN.
+    """
+    plates = np.asarray(plates, dtype=float)
+    slopes = {}
+    for stage, seconds in timings.items():
+        seconds = np.asarray(seconds, dtype=float)
+        usable = np.flatnonzero(seconds >= MIN_SECONDS)
+        usable = usable[-max(2, -(-len(usable) // 2)):]
+        if len(np.unique(plates[usable])) < 2:
+            slopes[stage] = np.nan
+            continue
+        slopes[stage] = np.polyfit(np.log(plates[usable]), np.log(seconds[usable]), 1)[0]
+    return slopes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--treatments', type=int, nargs='+', default=list(TREATMENTS))
+    parser.add_argument('--positions', type=int, nargs='+', default=list(POSITIONS))
+    parser.add_argument('--replicates', type=int, nargs='+', default=list(REPLICATES))
+    parser.add_argument('--plates', type=int, nargs='+', default=list(PLATES))
+    parser.add_argument('--n-resamples', type=int, default=1000, help='bootstrap resamples per run')
+    parser.add_argument('--n-permutations', type=int, default=1000, help='permutations per ANOVA term')
+    parser.add_argument('--slope-limit', type=float, default=SLOPE_LIMIT)
+    parser.add_argument('--json', metavar='FILE', help='also write the timings and exponents as JSON')
+    args = parser.parse_args(argv)
+
+    # (total plates, treatments, positions, replicates, plates per replicate), smallest first
+    designs = sorted((t * s * r * p, t, s, r, p) for t in args.treatments for s in args.positions
+                     for r in args.replicates for p in args.plates)
+    with tempfile.TemporaryDirectory() as workdir:
+        # Warm-up on the smallest design so one-off imports do not count as stage time
+        run_design(*designs[0][1:], workdir, args.n_resamples, args.n_permutations)
+        runs = []
+        for n_plates_total, n_treatments, n_positions, n_replicates, n_plates in designs:
+            print(f"{n_treatments} treatments x {n_positions} positions x {n_replicates} replicates x "
+                  f"{n_plates} plates ({n_plates_total:,} plates) ...", file=sys.stderr)
+            runs.append(run_design(n_treatments, n_positions, n_replicates, n_plates, workdir,
+                                   args.n_resamples, args.n_permutations))
+
+    # Designs with the same number of plates are told apart by a t x s x r x p label
+    labels = [f'{d[0]} ({d[1]}x{d[2]}x{d[3]}x{d[4]})' for d in designs]
+    table = pd.DataFrame(runs, index=pd.Index(labels, name='plates')).T
+    slopes = scaling_exponents({stage: table.loc[stage].to_numpy() for stage in table.index},
+                               [d[0] for d in designs])
+    table['exponent'] = pd.Series(slopes)
+    table['superlinear'] = table['exponent'] > args.slope_limit
+    with pd.option_context('display.width', 160, 'display.max_columns', 30):
+        print(table.round(4).to_string())
+    flagged = table.index[table['superlinear']].tolist()
+    print(f"\nstages growing faster than plates^{args.slope_limit:g}: {', '.join(flagged) if flagged else 'none'}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'designs': [{'plates': d[0], 'treatments': d[1], 'positions': d[2], 'replicates': d[3],
+                             'plates_per_replicate': d[4]} for d in designs],
+                'seconds': {stage: table.loc[stage, labels].tolist() for stage in table.index},
+                'exponents': {stage: (None if np.isnan(s) else s) for stage, s in slopes.items()},
+                'slope_limit': args.slope_limit,
+                'flagged': flagged,
+            }, f, indent=2)
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
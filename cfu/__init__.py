@@ -0,0 +1,3 @@
+"""Shared analysis code for the CFU Treatment x Position experiments."""
+
+__version__ = '0.1.0'
@@ -0,0 +1,5 @@
+import sys
+
+from cfu.cli import main
+
+sys.exit(main())
@@ -0,0 +1,152 @@
+"""Two-way ANOVA (type II) for the Treatment x Position design.
+
+Balanced layouts get their sums of squares straight from cell and marginal
+means, so a whole block of response columns is analysed with a handful of
+NumPy reductions. Unbalanced or incomplete data falls back to statsmodels'
+OLS + anova_lm path, which gives the same tables.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def term_names(factor_a='Treatment', factor_b='Position'):
+    """Row labels used by anova_lm for the two-way model."""
+    return [f'C({factor_a})', f'C({factor_b})', f'C({factor_a}):C({factor_b})', 'Residual']
+
+
+def factor_codes(data, factor):
+    """Integer codes and level count for a factor column (categories kept in order)."""
+    codes, levels = pd.factorize(data[factor], sort=True)
+    return codes, len(levels)
+
+
+def cell_counts(a_codes, b_codes, n_a, n_b):
+    """Number of observations in each a x b cell, as an (n_a, n_b) array."""
+    return np.bincount(a_codes * n_b + b_codes, minlength=n_a * n_b).reshape(n_a, n_b)
+
+
+def is_balanced(counts):
+    """True when every cell is present and holds the same number of observations."""
+    return counts.min() > 0 and counts.min() == counts.max()
+
+
+def balanced_sums_of_squares(Y, a_codes, b_codes, n_a, n_b):
+    """Sums of squares and degrees of freedom for a balanced two-way layout.
+
+    Y is (n_obs, n_responses). Returns sum_sq with shape (4, n_responses) in
+    the order A, B, A:B, Residual, and the matching df vector.
+    """
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    n_cells = n_a * n_b
+    n = len(Y) // n_cells
+
+    # Group the rows cell by cell so the cells become a reshape instead of a groupby
+    order = np.argsort(a_codes * n_b + b_codes, kind='stable')
+    cells = Y[order].reshape(n_cells, n, Y.shape[1])
+    cell_means = cells.mean(axis=1)
+
+    grid = cell_means.reshape(n_a, n_b, -1)
+    grand = grid.mean(axis=(0, 1))
+    a_means = grid.mean(axis=1)
+    b_means = grid.mean(axis=0)
+
+    ss_a = n * n_b * ((a_means - grand) ** 2).sum(axis=0)
+    ss_b = n * n_a * ((b_means - grand) ** 2).sum(axis=0)
+    ss_ab = n * ((grid - a_means[:, None] - b_means[None] + grand) ** 2).sum(axis=(0, 1))
+    ss_e = ((cells - cell_means[:, None]) ** 2).sum(axis=(0, 1))
+
+    df = np.array([n_a - 1, n_b - 1, (n_a - 1) * (n_b - 1), len(Y) - n_cells], dtype=float)
+    return np.vstack([ss_a, ss_b, ss_ab, ss_e]), df
+
+
+def anova_from_sums_of_squares(sum_sq, df, index):
+    """Build anova_lm-style tables (one per response column) from sums of squares."""
+    mean_sq = sum_sq / df[:, None]
+    F = mean_sq[:3] / mean_sq[3]
+    p = stats.f.sf(F, df[:3, None], df[3])
+    tables = []
+    for k in range(sum_sq.shape[1]):
+        tables.append(pd.DataFrame({
+            'sum_sq': sum_sq[:, k],
+            'df': df,
+            'F': np.append(F[:, k], np.nan),
+            'PR(>F)': np.append(p[:, k], np.nan),
+        }, index=index))
+    return tables
+
+
+def cell_sums_of_squares(counts, means, m2):
+    """Type II sums of squares and df from per-cell count, mean and M2 arrays of shape (n_a, n_b).
+
+    The cell statistics are sufficient for the two-way model, so this gives
+    the same table as the OLS path for balanced and unbalanced data alike:
+    the between-cell part comes from weighted least squares on the cell
+    means, the residual is the pooled within-cell M2.
+    """
+    n_a, n_b = counts.shape
+    present = (counts > 0).ravel()
+    w = counts.ravel()[present].astype(float)
+    y = means.ravel()[present]
+    a = np.repeat(np.arange(n_a), n_b)[present]
+    b = np.tile(np.arange(n_b), n_a)[present]
+    A = (a[:, None] == np.arange(1, n_a)).astype(float)
+    B = (b[:, None] == np.arange(1, n_b)).astype(float)
+    AB = (A[:, :, None] * B[:, None, :]).reshape(len(y), -1)
+    one = np.ones((len(y), 1))
+
+    def fit(*blocks):
+        X = np.hstack(blocks) * np.sqrt(w)[:, None]
+        coef, _, rank, _ = np.linalg.lstsq(X, y * np.sqrt(w), rcond=None)
+        return ((y * np.sqrt(w) - X @ coef) ** 2).sum(), rank
+
+    rss_a, rank_a = fit(one, A)
+    rss_b, rank_b = fit(one, B)
+    rss_ab, rank_ab = fit(one, A, B)
+    rss_full, rank_full = fit(one, A, B, AB)
+    sum_sq = np.array([rss_b - rss_ab, rss_a - rss_ab, rss_ab - rss_full, m2[counts > 0].sum()])
+    df = np.array([rank_ab - rank_b, rank_ab - rank_a, rank_full - rank_ab,
+                   counts.sum() - rank_full], dtype=float)
+    return np.clip(sum_sq, 0, None)[:, None], df
+
+
+def ols_two_way_anova(data, dv, factor_a='Treatment', factor_b='Position'):
+    """Type II two-way ANOVA through statsmodels, for unbalanced data."""
+    import statsmodels.api as sm
+    from statsmodels.formula.api import ols
+
+    formula = f'Q("{dv}") ~ C({factor_a}) + C({factor_b}) + C({factor_a}):C({factor_b})'
+    model = ols(formula, data=data).fit()
+    return sm.stats.anova_lm(model, typ=2)
+
+
+def two_way_anovas(data, dvs, factor_a='Treatment', factor_b='Position'):
+    """Type II two-way ANOVA tables for several response columns in one call.
+
+    Returns a dict mapping each column in dvs to its table. Columns with
+    missing values, or designs that are not balanced, use the OLS path.
+    """
+    a_codes, n_a = factor_codes(data, factor_a)
+    b_codes, n_b = factor_codes(data, factor_b)
+    counts = cell_counts(a_codes, b_codes, n_a, n_b)
+    index = term_names(factor_a, factor_b)
+
+    Y = data[list(dvs)].to_numpy(dtype=float)
+    complete = ~np.isnan(Y).any(axis=0)
+    tables = {}
+    if is_balanced(counts) and complete.any():
+        fast = [dv for dv, ok in zip(dvs, complete) if ok]
+        sum_sq, df = balanced_sums_of_squares(Y[:, complete], a_codes, b_codes, n_a, n_b)
+        tables.update(zip(fast, anova_from_sums_of_squares(sum_sq, df, index)))
+    for dv in dvs:
+        if dv not in tables:
+            tables[dv] = ols_two_way_anova(data, dv, factor_a, factor_b)
+    return {dv: tables[dv] for dv in dvs}
+
+
+def two_way_anova(data, dv='CFU', factor_a='Treatment', factor_b='Position'):
+    """Type II ANOVA table for CFU ~ C(Treatment) + C(Position) + C(Treatment):C(Position)."""
+    return two_way_anovas(data, [dv], factor_a, factor_b)[dv]
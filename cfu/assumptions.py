@@ -0,0 +1,153 @@
+"""ANOVA assumption checks computed for all Treatment x Position groups at once.
+
+The rows are grouped once (a stable sort on the group code); Shapiro-Wilk,
+Levene / Brown-Forsythe and the residual diagnostics then all work from
+that sorted layout with bincount reductions, writing into preallocated
+arrays instead of growing a DataFrame group by group.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+ALPHA = 0.05
+
+
+def sorted_groups(data, dv, factors):
+    """Group codes in first-appearance order and the sorted layout shared by all checks.
+
+    Returns (codes, labels, order, counts, starts) where order sorts the rows
+    by group and by value within each group.
+    """
+    if len(factors) == 1:
+        codes, levels = pd.factorize(data[factors[0]])
+        labels = np.asarray(levels).astype(str)
+    else:
+        codes, levels = pd.factorize(pd.MultiIndex.from_frame(data[factors]))
+        labels = np.array(['_'.join(map(str, level)) for level in levels])
+    y = data[dv].to_numpy(dtype=float)
+    order = np.lexsort((y, codes))
+    counts = np.bincount(codes, minlength=len(labels))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return codes, labels, order, counts, starts
+
+
+def group_medians(y_sorted, counts, starts):
+    """Median of each group from values sorted within groups."""
+    lo = y_sorted[starts + (counts - 1) // 2]
+    hi = y_sorted[starts + counts // 2]
+    return (lo + hi) / 2
+
+
+def shapiro_by_group(y_sorted, counts, starts):
+    """Shapiro-Wilk W and p for every group, as arrays (NaN for groups under 3 values)."""
+    n_groups = len(counts)
+    W = np.full(n_groups, np.nan)
+    p = np.full(n_groups, np.nan)
+    testable = counts >= 3
+    if testable.all() and counts.min() == counts.max():
+        # Equal group sizes: one vectorized call over a (groups, n) block
+        W[:], p[:] = stats.shapiro(y_sorted.reshape(n_groups, -1), axis=1)
+        return W, p
+    for g in np.flatnonzero(testable):
+        W[g], p[g] = stats.shapiro(y_sorted[starts[g]:starts[g] + counts[g]])
+    return W, p
+
+
+def one_way_f(values, codes, counts):
+    """One-way ANOVA F statistic and p-value of values across group codes."""
+    n_groups = np.count_nonzero(counts)
+    n = counts.sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.bincount(codes, weights=values, minlength=len(counts)) / counts
+    grand = values.mean()
+    ss_between = np.nansum(counts * (means - grand) ** 2)
+    ss_within = ((values - means[codes]) ** 2).sum()
+    df_between, df_within = n_groups - 1, n - n_groups
+    F = (ss_between / df_between) / (ss_within / df_within)
+    return F, stats.f.sf(F, df_between, df_within)
+
+
+def moments_by_group(values, codes, counts):
+    """Mean, SD (ddof=1), skewness and excess kurtosis of values per group code."""
+    n_groups = len(counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(codes, weights=values, minlength=n_groups) / counts
+        dev = values - mean[codes]
+        m2 = np.bincount(codes, weights=dev ** 2, minlength=n_groups) / counts
+        m3 = np.bincount(codes, weights=dev ** 3, minlength=n_groups) / counts
+        m4 = np.bincount(codes, weights=dev ** 4, minlength=n_groups) / counts
+        sd = np.sqrt(m2 * counts / (counts - 1))
+        skew = m3 / m2 ** 1.5
+        kurtosis = m4 / m2 ** 2 - 3
+    return mean, sd, skew, kurtosis
+
+
+def check_assumptions(data, dv='CFU', factors=('Treatment', 'Position'), alpha=ALPHA):
+    """Normality, equal-variance and residual checks for the Treatment x Position cells.
+
+    Returns a dict with:
+      normality_results  Shapiro-Wilk per group (Treatment_Position, W, p, Normal)
+      levene_stat/_p     median-centred Levene test (scipy's default, i.e. Brown-Forsythe)
+      equal_variance     levene_p > alpha
+      variance_tests     mean- and median-centred Levene statistics side by side
+      residuals          per-group residual diagnostics from the cell-means model
+      residual_W/_p      Shapiro-Wilk on all residuals pooled
+    """
+    factors = list(factors)
+    codes, labels, order, counts, starts = sorted_groups(data, dv, factors)
+    y = data[dv].to_numpy(dtype=float)
+    y_sorted = y[order]
+    codes_sorted = codes[order]
+
+    # Normality within each group
+    W, p = shapiro_by_group(y_sorted, counts, starts)
+    normality_results = pd.DataFrame({
+        '_'.join(factors): labels,
+        'W': W,
+        'p': p,
+        'Normal': p > alpha,
+    })
+
+    # Homogeneity of variance: Levene (mean-centred) and Brown-Forsythe (median-centred)
+    means = np.bincount(codes_sorted, weights=y_sorted, minlength=len(counts)) / counts
+    medians = group_medians(y_sorted, counts, starts)
+    levene_mean = one_way_f(np.abs(y_sorted - means[codes_sorted]), codes_sorted, counts)
+    levene_median = one_way_f(np.abs(y_sorted - medians[codes_sorted]), codes_sorted, counts)
+    variance_tests = pd.DataFrame([levene_mean, levene_median], columns=['W', 'p'],
+                                  index=['Levene (mean)', 'Brown-Forsythe (median)'])
+    variance_tests['Equal variance'] = variance_tests['p'] > alpha
+
+    # Residuals of the full Treatment x Position model are deviations from the cell means
+    residuals = y_sorted - means[codes_sorted]
+    pooled_sd = np.sqrt((residuals ** 2).sum() / (len(y) - np.count_nonzero(counts)))
+    _, sd, skew, kurtosis = moments_by_group(residuals, codes_sorted, counts)
+    max_std = np.zeros(len(counts))
+    np.maximum.at(max_std, codes_sorted, np.abs(residuals) / pooled_sd)
+    residual_table = pd.DataFrame({
+        '_'.join(factors): labels,
+        'n': counts,
+        'sd': sd,
+        'skew': skew,
+        'kurtosis': kurtosis,
+        'max |std resid|': max_std,
+    })
+    residual_W, residual_p = stats.shapiro(residuals) if len(residuals) >= 3 else (np.nan, np.nan)
+
+    levene_stat, levene_p = levene_median
+    return {
+        'normality_results': normality_results,
+        'levene_stat': levene_stat,
+        'levene_p': levene_p,
+        'equal_variance': levene_p > alpha,
+        'variance_tests': variance_tests,
+        'residuals': residual_table,
+        'residual_W': residual_W,
+        'residual_p': residual_p,
+    }
+
+
+def assumptions_met(assumptions):
+    """True when every group passed Shapiro-Wilk (where testable) and Levene found equal variances."""
+    normal = assumptions['normality_results']
+    return bool(assumptions['equal_variance'] and normal['Normal'][normal['p'].notna()].all())
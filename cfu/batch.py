@@ -0,0 +1,185 @@
+"""Run the analysis over many experiment CSVs with a process pool.
+
+Each experiment gets its own output directory (figures, reports, results
+store and artifact cache) under the batch output directory. A failing experiment is recorded
+in the consolidated summary instead of stopping the batch. A worker process that dies (killed,
+out of memory) breaks the whole pool; the experiments it may have been running are then rerun
+one per pool, so only the one that kills its worker again is recorded as failed, and the rest
+of the batch carries on in a fresh pool.
+"""
+
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from cfu.cache import ArtifactCache
+from cfu.profiling import PROFILE_DIR, TRACE_FILE, Profiler
+from cfu.pipeline import (DPI, MAX_PERMUTATIONS, N_RESAMPLES, PERM_PRECISION, SEED, build_stages, build_targets,
+                          statistics)
+
+SUMMARY_FILE = 'batch_summary.csv'
+
+
+def find_experiments(inputs):
+    """Expand directories (all *.csv inside) and glob patterns into a sorted list of CSVs."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(glob.glob(os.path.join(item, '*.csv')))
+        else:
+            paths.extend(glob.glob(item) or [item])
+    return sorted(set(paths))
+
+
+def experiment_names(paths):
+    """Output directory names: the file stem, prefixed by its parent when stems collide."""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    names = []
+    for path, stem in zip(paths, stems):
+        if stems.count(stem) > 1:
+            stem = f'{os.path.basename(os.path.dirname(os.path.abspath(path)))}_{stem}'
+        names.append(stem.replace(' ', '_'))
+    return names
+
+
+def summary_row(results):
+    """Flatten one experiment's p-values (ANOVA, permutation, GLM, Tukey, rank tests) and efficacies into a dict."""
+    row = {}
+    anova = results['anova']
+    for term in anova.index[:-1]:
+        label = term.replace('C(', '').replace(')', '')
+        row[f'anova_p[{label}]'] = anova.at[term, 'PR(>F)']
+        if not isinstance(results['permutation'], dict):
+            row[f'perm_p[{label}]'] = results['permutation'].at[term, 'p-perm']
+        if results['nonparametric'] is not None:
+            row[f'art_p[{label}]'] = results['nonparametric']['art'].at[term, 'PR(>F)']
+        row[f'nb_p[{label}]'] = results['count_model']['negbin'].at[term, 'PR(>Chi2)']
+
+    summary = results['summary'].dropna(subset=['efficacy'])
+    for treatment, position, efficacy in summary[['Treatment', 'Position', 'efficacy']].itertuples(index=False):
+        row[f'efficacy[{treatment}|{position}]'] = efficacy
+
+    posthoc = results['posthoc']
+    for key in ('treatment', 'position'):
+        for a, b, p in posthoc[key][['A', 'B', 'p-tukey']].itertuples(index=False):
+            row[f'tukey_p[{a} vs {b}]'] = p
+    for a, b, p, position in posthoc['interaction'][['A', 'B', 'p-tukey', 'Position']].itertuples(index=False):
+        row[f'tukey_p[{a} vs {b}|{position}]'] = p
+    if results['nonparametric'] is not None:
+        dunn = results['nonparametric']['dunn']
+        for a, b, p, position in dunn[['A', 'B', 'p-holm', 'Position']].itertuples(index=False):
+            row[f'dunn_p[{a} vs {b}|{position}]'] = p
+
+    for treatment, eff, low, high in results['efficacy']['overall'].itertuples(index=False):
+        row[f'efficacy[{treatment}]'] = eff
+        row[f'efficacy_ci_low[{treatment}]'] = low
+        row[f'efficacy_ci_high[{treatment}]'] = high
+    for treatment, ratio, low, high, _ in results['count_model']['overall'].itertuples(index=False):
+        row[f'rate_ratio[{treatment}]'] = ratio
+        row[f'rate_ratio_ci_low[{treatment}]'] = low
+        row[f'rate_ratio_ci_high[{treatment}]'] = high
+    return row
+
+
+def run_experiment(csv_path, outdir, use_cache=True, dpi=DPI, stats_only=False,
+                   n_resamples=N_RESAMPLES, seed=SEED, max_permutations=MAX_PERMUTATIONS,
+                   perm_precision=PERM_PRECISION, profile=False, cprofile=()):
+    """Analyse one CSV into outdir; returns a summary row and never raises.
+
+    With profile (or cprofile) the experiment's trace goes to outdir/cfu_profile.json.
+    """
+    start = time.perf_counter()
+    row = {'experiment': os.path.basename(outdir), 'csv': csv_path, 'outdir': outdir}
+    profiler = None
+    if profile or cprofile:
+        profiler = Profiler(cprofile, profile_dir=os.path.join(outdir, PROFILE_DIR))
+    try:
+        os.makedirs(outdir, exist_ok=True)
+        cache = ArtifactCache(os.path.join(outdir, '.cfu_cache') if use_cache else None, profiler=profiler)
+        # The batch pool already keeps every core busy, so resample and render in-process
+        stages = build_stages(csv_path, outdir, cache, dpi=dpi, n_resamples=n_resamples,
+                              seed=seed, workers=1, max_permutations=max_permutations,
+                              perm_precision=perm_precision)
+        results = statistics(stages, workers=1)
+        # The results store is written either way, so reports can be rendered later without recomputing
+        build_targets(stages, ['results'] if stats_only else ['report'], workers=1)
+        row.update(status='ok', error='', n_plates=len(stages['tidy'].value))
+        row.update(summary_row(results))
+    except Exception as exc:
+        row.update(status='failed', error=f'{type(exc).__name__}: {exc}',
+                   traceback=traceback.format_exc())
+    row['seconds'] = time.perf_counter() - start
+    if profiler is not None and os.path.isdir(outdir):
+        profiler.write_trace(os.path.join(outdir, TRACE_FILE), {'seconds': row['seconds']})
+    return row
+
+
+def _run_pool(jobs, workers, options, rows, progress):
+    """Run jobs in one process pool until they are done or a worker dies; returns the jobs not finished."""
+    finished = set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_experiment, path, exp_dir, *options): (path, exp_dir)
+                   for path, exp_dir in jobs}
+        for future in as_completed(futures):
+            path, exp_dir = futures[future]
+            try:
+                row = future.result()
+            except BrokenProcessPool:
+                break
+            except Exception as exc:
+                row = _failed_row(path, exp_dir, exc)
+            rows.append(row)
+            finished.add((path, exp_dir))
+            progress(f"{row['experiment']}: {row['status']}")
+    return [job for job in jobs if job not in finished]
+
+
+def _failed_row(path, exp_dir, exc):
+    return {'experiment': os.path.basename(exp_dir), 'csv': path, 'outdir': exp_dir,
+            'status': 'failed', 'error': f'{type(exc).__name__}: {exc}'}
+
+
+def run_batch(csv_paths, outdir, workers=None, use_cache=True, dpi=DPI, stats_only=False,
+              n_resamples=N_RESAMPLES, seed=SEED, max_permutations=MAX_PERMUTATIONS,
+              perm_precision=PERM_PRECISION, profile=False, cprofile=(), progress=print):
+    """Analyse every CSV in a process pool and write the consolidated summary.
+
+    Returns the summary as a DataFrame with one row per experiment.
+    """
+    import pandas as pd
+
+    names = experiment_names(csv_paths)
+    jobs = [(path, os.path.join(outdir, name)) for path, name in zip(csv_paths, names)]
+    options = (use_cache, dpi, stats_only, n_resamples, seed, max_permutations, perm_precision,
+               profile, tuple(cprofile))
+    rows = []
+    if workers == 1:
+        for path, exp_dir in jobs:
+            rows.append(run_experiment(path, exp_dir, *options))
+            progress(f"{rows[-1]['experiment']}: {rows[-1]['status']}")
+    else:
+        pending = jobs
+        while pending:
+            pending = _run_pool(pending, workers, options, rows, progress)
+            # A worker died: jobs are handed out in order, so the ones it can have been running are the
+            # first unfinished ones (one per worker plus the one call the pool queues ahead)
+            in_flight = pending[:(workers or os.cpu_count() or 1) + 1]
+            for path, exp_dir in in_flight:
+                if _run_pool([(path, exp_dir)], 1, options, rows, progress):
+                    rows.append(_failed_row(path, exp_dir, BrokenProcessPool(
+                        'the worker process died while analysing this experiment')))
+                    progress(f"{rows[-1]['experiment']}: failed")
+            pending = pending[len(in_flight):]
+
+    summary = pd.DataFrame(rows).sort_values('experiment', kind='stable').reset_index(drop=True)
+    os.makedirs(outdir, exist_ok=True)
+    summary.drop(columns='traceback', errors='ignore').to_csv(os.path.join(outdir, SUMMARY_FILE), index=False)
+    for row in rows:
+        if row['status'] == 'failed' and row.get('traceback'):
+            os.makedirs(row['outdir'], exist_ok=True)
+            with open(os.path.join(row['outdir'], 'error.txt'), 'w') as f:
+                f.write(row['traceback'])
+    return summary
@@ -0,0 +1,132 @@
+"""Bootstrap confidence intervals for treatment efficacy.
+
+Plates are resampled with replacement within each Treatment x Position x
+Replicate cell, so every resample keeps the design of the experiment. A
+chunk of resamples is one (chunk, n_plates) index array drawn in a single
+call; the Treatment x Position means come from np.add.reduceat over that
+block. Chunks get independent seeds spawned from one SeedSequence, so the
+result for a given seed does not depend on how many workers run them.
+
+Worker processes take about a second each to start, so small problems are
+resampled in this process. Larger ones go to the pool the caller passes
+(the pipeline's figure pool, say) or to one started with the spawn method:
+the pipeline runs this while its threads wait on figures, and forking a
+process that has threads running is not safe.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+N_RESAMPLES = 10000
+CI = 95
+CHUNK_ELEMENTS = 4_000_000  # resampled values held in memory per chunk
+PARALLEL_ELEMENTS = 100_000_000  # resampled values below which worker processes cost more than they save
+
+
+def _bootstrap_chunk(seed, n_resamples, y_sorted, cell_start, cell_count, group_starts, group_counts):
+    """Treatment x Position means for one chunk of resamples, shape (n_resamples, n_groups)."""
+    rng = np.random.default_rng(seed)
+    idx = cell_start + rng.integers(0, cell_count, size=(n_resamples, len(y_sorted)))
+    sums = np.add.reduceat(y_sorted[idx], group_starts, axis=1)
+    return sums / group_counts
+
+
+def bootstrap_group_means(data, dv='CFU', groups=('Treatment', 'Position'), within='Replicate',
+                          n_resamples=N_RESAMPLES, seed=0, workers=None, chunk_size=None, pool=None):
+    """Bootstrap distribution of the group means, resampling rows within group x `within` cells.
+
+    Returns (labels, means): a DataFrame of the group levels and an
+    (n_resamples, n_groups) array whose columns follow those rows. Rows
+    with a missing dv (blank plates) are not resampled.
+    """
+    groups = list(groups)
+    data = data.dropna(subset=[dv])
+    codes = [pd.factorize(data[col], sort=True)[0] for col in groups + [within]]
+    order = np.lexsort(codes[::-1])
+    y_sorted = data[dv].to_numpy(dtype=float)[order]
+
+    # Position of every sorted row's cell (and group) in the sorted layout
+    changed = [np.r_[True, c[order][1:] != c[order][:-1]] for c in codes]
+    group_break = np.logical_or.reduce(changed[:len(groups)])
+    cell_break = group_break | changed[-1]
+
+    cell_id = np.cumsum(cell_break) - 1
+    cell_starts = np.flatnonzero(cell_break)
+    cell_counts = np.diff(np.r_[cell_starts, len(order)])
+    group_starts = np.flatnonzero(group_break)
+    group_counts = np.diff(np.r_[group_starts, len(order)])
+    labels = data.iloc[order[group_starts]][groups].reset_index(drop=True)
+
+    # Fixed chunking (independent of the worker count) keeps results reproducible
+    chunk_size = chunk_size or max(1, CHUNK_ELEMENTS // max(len(order), 1))
+    sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = (y_sorted, cell_starts[cell_id], cell_counts[cell_id], group_starts, group_counts)
+
+    if workers == 1 or len(sizes) == 1 or n_resamples * len(order) < PARALLEL_ELEMENTS:
+        return labels, np.vstack([_bootstrap_chunk(s, n, *args) for s, n in zip(seeds, sizes)])
+
+    own_pool = None
+    if pool is None:
+        pool = own_pool = ProcessPoolExecutor(max_workers=workers or min(len(sizes), os.cpu_count() or 1),
+                                              mp_context=multiprocessing.get_context('spawn'))
+    try:
+        futures = [pool.submit(_bootstrap_chunk, s, n, *args) for s, n in zip(seeds, sizes)]
+        chunks = [future.result() for future in futures]
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+    return labels, np.vstack(chunks)
+
+
+def efficacy(control_means, treated_means):
+    """Percent reduction of the treated mean relative to the control mean."""
+    return (control_means - treated_means) / control_means * 100
+
+
+def efficacy_intervals(data, dv='CFU', control='Control', n_resamples=N_RESAMPLES, ci=CI,
+                       seed=0, workers=None, pool=None):
+    """Point estimates and percentile bootstrap CIs of efficacy against the control.
+
+    Returns {'by_position': DataFrame, 'overall': DataFrame}. Overall efficacy
+    compares the unweighted average of a treatment's position means with the
+    same average for the control.
+    """
+    labels, boot = bootstrap_group_means(data, dv, n_resamples=n_resamples, seed=seed, workers=workers, pool=pool)
+    observed = data.groupby(['Treatment', 'Position'], observed=True)[dv].mean()
+    point = observed.reindex(pd.MultiIndex.from_frame(labels)).to_numpy()
+    tails = [(100 - ci) / 2, 100 - (100 - ci) / 2]
+
+    # Per position: each treated column against the control column of the same position
+    column = pd.Series(np.arange(len(labels)), index=pd.MultiIndex.from_frame(labels))
+    treated = labels[labels['Treatment'] != control].reset_index(drop=True)
+    t_cols = column.reindex(pd.MultiIndex.from_frame(treated)).to_numpy()
+    c_cols = column.reindex(pd.MultiIndex.from_arrays(
+        [np.full(len(treated), control), treated['Position']])).to_numpy()
+    boot_eff = efficacy(boot[:, c_cols], boot[:, t_cols])
+    low, high = np.percentile(boot_eff, tails, axis=0)
+    by_position = treated.assign(efficacy=efficacy(point[c_cols], point[t_cols]),
+                                 ci_low=low, ci_high=high)
+
+    # Overall: average the position means of each treatment with one matrix product
+    t_codes, treatments = pd.factorize(labels['Treatment'], sort=True)
+    weights = np.zeros((len(labels), len(treatments)))
+    weights[np.arange(len(labels)), t_codes] = 1
+    weights /= weights.sum(axis=0)
+    boot_overall = boot @ weights
+    point_overall = point @ weights
+    c = list(treatments).index(control)
+    others = [i for i in range(len(treatments)) if i != c]
+    boot_eff = efficacy(boot_overall[:, [c]], boot_overall[:, others])
+    low, high = np.percentile(boot_eff, tails, axis=0)
+    overall = pd.DataFrame({
+        'Treatment': np.asarray(treatments)[others],
+        'efficacy': efficacy(point_overall[c], point_overall[others]),
+        'ci_low': low,
+        'ci_high': high,
+    })
+    return {'by_position': by_position, 'overall': overall, 'n_resamples': n_resamples, 'ci': ci}
@@ -0,0 +1,255 @@
+"""Content-addressed cache for pipeline stage results.
+
+Each stage's key is a hash of its inputs' keys, its parameters and the
+source code that produces it. Results are pickled under objects/<key>.pkl,
+and stages that write files (figures, the report) record their output
+hashes in manifest.json. Keys can be worked out without loading any data,
+so a rerun on unchanged inputs never has to touch pandas at all.
+
+A stage declared with cutoff=True passes the hash of its pickled value to
+its dependants instead of its key. An input edit that does not change that
+value (a retyped 'average' column, reformatted numbers) then stops there,
+and everything downstream stays cached.
+"""
+
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import pickle
+import threading
+
+from cfu.profiling import measure
+
+CACHE_DIR = '.cfu_cache'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_version(obj):
+    """Hash of the source behind obj: a function, a module, a dotted module name or a file path.
+
+    Module names are resolved without importing the module, so hashing
+    cfu.plots does not pull in matplotlib. Absolute paths (report
+    templates, for instance) are hashed as files.
+    """
+    if isinstance(obj, str):
+        return file_digest(obj if os.path.isabs(obj) else importlib.util.find_spec(obj).origin)
+    return hashlib.sha256(inspect.getsource(obj).encode()).hexdigest()
+
+
+def stage_key(name, dep_keys, params=None, code=()):
+    """Key for a stage from its name, upstream keys, parameters and code versions."""
+    payload = json.dumps({
+        'stage': name,
+        'deps': list(dep_keys),
+        'params': params,
+        'code': [code_version(obj) for obj in code],
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Artifact:
+    """One stage of the pipeline: a key plus a way to load or compute its value."""
+
+    def __init__(self, cache, name, key, compute=None, deps=(), outputs=(), value=None,
+                 params=None, code=(), cutoff=False, kind='stage'):
+        self.cache = cache
+        self.name = name
+        self.kind = kind
+        self._key = key
+        self.compute = compute
+        self.deps = list(deps)
+        self.outputs = list(outputs)
+        self.params = params
+        self.code = list(code)
+        self.cutoff = cutoff
+        self._value = value
+        self._loaded = compute is None
+        self._digest = None
+        self._lock = threading.Lock()
+        self.recomputed = False
+
+    @property
+    def key(self):
+        """Cache key, worked out on first use (a cutoff dependency may need its value for it)."""
+        if self._key is None:
+            self._key = stage_key(self.name, [dep.ref for dep in self.deps], self.params, self.code)
+        return self._key
+
+    @property
+    def ref(self):
+        """What dependants hash: the key, or for a cutoff stage the digest of its value."""
+        if not self.cutoff:
+            return self.key
+        if self._digest is None:
+            self._digest = self.cache.digest(self.key)
+            if self._digest is None:
+                self.value
+                self._digest = self.cache.digest(self.key, self._value)
+        return self._digest
+
+    @property
+    def fresh(self):
+        """True when the cache already holds this key (and its output files are intact)."""
+        if self.outputs:
+            entry = self.cache.manifest.get(self.name, {})
+            if entry.get('key') != self.key:
+                return False
+            recorded = entry.get('outputs', {})
+            return all(os.path.exists(path) and recorded.get(path) == file_digest(path)
+                       for path in self.outputs)
+        return self._loaded or self.cache.has(self.key)
+
+    @property
+    def value(self):
+        """The stage result, from memory, from the object store or freshly computed."""
+        return self.evaluate()
+
+    def evaluate(self, executor=None):
+        """The stage's value, computing it at most once even when called from several threads.
+
+        An executor (e.g. a process pool) runs the computation there instead
+        of in this thread; compute and its arguments must then be picklable.
+        """
+        with self._lock:
+            if not self._loaded:
+                if not self.outputs and self.cache.has(self.key):
+                    self._value = self.cache.timed(self.name, self.cache.load, [self.key], kind='load')
+                else:
+                    args = [dep.value for dep in self.deps]
+                    self._value = self.cache.timed(self.name, self.compute, args, self.kind, executor)
+                    self.recomputed = True
+                    if self.outputs:
+                        self.cache.record(self)
+                    else:
+                        self.cache.store(self.key, self._value, self.name)
+                self._loaded = True
+        return self._value
+
+    def build(self, executor=None):
+        """Make sure the stage's outputs are current; returns True if it had to run."""
+        if self.fresh:
+            return False
+        self.evaluate(executor)
+        return True
+
+
+class ArtifactCache:
+    """Object store plus manifest of file-writing stages under one directory.
+
+    With root=None nothing is written to disk; the latest value of each
+    stage is kept in memory instead, so a cache that lives on (watch mode)
+    still skips the stages whose inputs did not change.
+    A cfu.profiling.Profiler, if given, records every stage computed or
+    loaded through the cache.
+    """
+
+    def __init__(self, root=CACHE_DIR, profiler=None):
+        self.root = root
+        self.profiler = profiler
+        self.manifest = {}
+        self._manifest_lock = threading.Lock()
+        self.digests = {}
+        self.memory = {}  # key -> value, for root=None
+        self._latest = {}  # stage name -> its key in memory
+        if root is None:
+            return
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        try:
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def timed(self, name, func, args=(), kind='stage', executor=None):
+        """func(*args), measured as a span of the profiler when there is one.
+
+        With an executor the call runs there (and is measured there).
+        """
+        if executor is None:
+            return func(*args) if self.profiler is None else self.profiler.run(name, func, args, kind)
+        if self.profiler is None:
+            return executor.submit(func, *args).result()
+        result, record = executor.submit(measure, func, args, name, kind, self.profiler.profile_to(name)).result()
+        self.profiler.add(record)
+        return result
+
+    def object_path(self, key):
+        return os.path.join(self.root, 'objects', f'{key}.pkl')
+
+    def has(self, key):
+        if self.root is None:
+            return key in self.memory
+        return os.path.exists(self.object_path(key))
+
+    def digest(self, key, value=None):
+        """SHA-256 of a stage's pickled value: from the object store, or of value if given.
+
+        Returns None when neither is available.
+        """
+        if key in self.digests:
+            return self.digests[key]
+        value = self.memory.get(key, value)
+        if self.root is not None and self.has(key):
+            self.digests[key] = file_digest(self.object_path(key))
+        elif value is not None:
+            self.digests[key] = hashlib.sha256(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+        return self.digests.get(key)
+
+    def load(self, key):
+        if self.root is None:
+            return self.memory[key]
+        with open(self.object_path(key), 'rb') as f:
+            return pickle.load(f)
+
+    def store(self, key, value, name=None):
+        if self.root is None:
+            # Only the latest value per stage, so memory does not grow with every rebuild
+            self.memory.pop(self._latest.get(name), None)
+            self._latest[name] = key
+            self.memory[key] = value
+            return
+        path = self.object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def record(self, artifact):
+        """Note that a file-writing stage has produced its outputs for its current key."""
+        entry = {'key': artifact.key, 'outputs': {path: file_digest(path) for path in artifact.outputs}}
+        with self._manifest_lock:
+            self.manifest[artifact.name] = entry
+            self.save_manifest()
+
+    def save_manifest(self):
+        if self.root is None:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f'{self.manifest_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def input(self, path):
+        """Source file artifact; its key is the file's content hash and its value the path."""
+        return Artifact(self, f'input:{path}', file_digest(path), value=path)
+
+    def stage(self, name, compute, deps=(), params=None, code=(), outputs=(), cutoff=False, kind='stage'):
+        """Declare a stage computed as compute(*dep values).
+
+        With cutoff, dependants are keyed on the digest of this stage's value.
+        kind labels the stage's profiler spans ('stage', 'figure').
+        """
+        return Artifact(self, name, None, compute, deps, outputs, params=params, code=code, cutoff=cutoff,
+                        kind=kind)
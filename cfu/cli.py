@@ -0,0 +1,351 @@
+"""Command-line entry point: python -m cfu {stats,plots,report,basic,all,batch,ingest,watch,power,render} ...
+
+Only the standard library is imported up front. The stats command never
+loads matplotlib, seaborn or statsmodels, and a fully cached run loads
+nothing heavy at all.
+"""
+
+import argparse
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from cfu.cache import ArtifactCache
+from cfu.profiling import PROFILE_DIR, TRACE_FILE, Profiler, top_functions
+from cfu.pipeline import (DPI, HTML_REPORT_FILE, MAX_PERMUTATIONS, N_RESAMPLES, PERM_PRECISION, REPORT_FILE,
+                          RESULTS_DIR, SEED, build_stages, build_targets, statistics)
+
+DEFAULT_CSV = 'cfu count thesis.csv'
+
+
+@contextmanager
+def import_timer(metrics):
+    """Accumulate the wall time spent importing not-yet-loaded modules into metrics.
+
+    Only the outermost import of a module is timed, so nested imports are
+    not double counted. The nesting depth is tracked per thread, since the
+    hook stays installed while the pipeline's waiter threads run.
+    """
+    original_import = builtins.__import__
+    state = threading.local()
+    lock = threading.Lock()
+
+    def timed_import(name, *args, **kwargs):
+        depth = getattr(state, 'depth', 0)
+        state.depth = depth + 1
+        if depth or name in sys.modules:
+            try:
+                return original_import(name, *args, **kwargs)
+            finally:
+                state.depth = depth
+        start = time.perf_counter()
+        try:
+            return original_import(name, *args, **kwargs)
+        finally:
+            state.depth = depth
+            with lock:
+                metrics['import_seconds'] += time.perf_counter() - start
+
+    metrics.setdefault('import_seconds', 0.0)
+    builtins.__import__ = timed_import
+    try:
+        yield metrics
+    finally:
+        builtins.__import__ = original_import
+
+
+def print_statistics(results):
+    """Print the statistics tables in the order of the original analysis script."""
+    import pandas as pd
+
+    with pd.option_context('display.width', 120, 'display.max_columns', 20):
+        print("Summary Statistics:")
+        print(results['summary'])
+        print("\nShapiro-Wilk Normality Test:")
+        print(results['assumptions']['normality_results'].to_string(index=False))
+        print("\nHomogeneity of Variance:")
+        print(results['assumptions']['variance_tests'])
+        print("\nResidual Diagnostics (cell-means model):")
+        print(results['assumptions']['residuals'].to_string(index=False))
+        print(f"Shapiro-Wilk on pooled residuals: W = {results['assumptions']['residual_W']:.4f}, "
+              f"p = {results['assumptions']['residual_p']:.4f}")
+        print("\nTwo-Way ANOVA Results:")
+        print(results['anova'])
+        print("\nPermutation ANOVA (replicate means, whole replicates shuffled):")
+        permutation = results['permutation']
+        print(f"not run ({permutation['skipped']})" if isinstance(permutation, dict) else permutation)
+        if results['nonparametric'] is not None:
+            print("\nAligned Rank Transform ANOVA (assumptions not met):")
+            print(results['nonparametric']['art'])
+            print("\nKruskal-Wallis test of Treatment within each Position:")
+            print(results['nonparametric']['kruskal'].to_string(index=False))
+            print("\nDunn's test within each Position (Holm-adjusted):")
+            print(results['nonparametric']['dunn'])
+        count_model = results['count_model']
+        print(f"\nNegative binomial GLM, likelihood-ratio tests (alpha = {count_model['alpha']:.4f}):")
+        print(count_model['negbin'])
+        print(f"\nPoisson GLM, likelihood-ratio tests (dispersion = {count_model['dispersion']:.4f}):")
+        print(count_model['poisson'])
+        print(f"\nRate ratios vs Control ({count_model['ci']:g}% Wald CI, negative binomial):")
+        print(count_model['by_position'].to_string(index=False))
+        print(count_model['overall'].to_string(index=False))
+        print("\nTukey's HSD Post-hoc Test for Treatment:")
+        print(results['posthoc']['treatment'])
+        print("\nTukey's HSD Post-hoc Test for Position:")
+        print(results['posthoc']['position'])
+        print("\nPost-hoc for interaction (Treatment × Position):")
+        print(results['posthoc']['interaction'])
+        print(f"\nEfficacy vs Control ({results['efficacy']['ci']:g}% bootstrap CI, "
+              f"{results['efficacy']['n_resamples']} resamples):")
+        print(results['efficacy']['by_position'].to_string(index=False))
+        print(results['efficacy']['overall'].to_string(index=False))
+
+
+def report_profile(profiler, trace_path, metrics=None):
+    """Write the JSON trace and print the span table (and any cProfile heads) to stderr."""
+    profiler.write_trace(trace_path, metrics)
+    print(profiler.summary(), file=sys.stderr)
+    for record in profiler.records:
+        if 'cprofile' in record:
+            print(f"\ncProfile of {record['name']} ({record['cprofile']}):", file=sys.stderr)
+            print(top_functions(record['cprofile']), file=sys.stderr)
+    print(f"profile trace written to {trace_path}", file=sys.stderr)
+
+
+def _stages(args):
+    cache = ArtifactCache(None if args.no_cache else args.cache_dir, profiler=args.profiler)
+    return build_stages(args.csv, args.outdir, cache, dpi=args.dpi, n_resamples=args.n_resamples,
+                        seed=args.seed, workers=args.workers, max_permutations=args.n_permutations,
+                        perm_precision=args.perm_precision)
+
+
+def print_basic(anova_table, posthoc):
+    """Print the tables of the basic analysis script."""
+    print("Two-Way ANOVA Results:")
+    print(anova_table)
+    print("\nTukey's HSD Post-hoc Test for Treatment:")
+    print(posthoc['treatment'])
+    print("\nTukey's HSD Post-hoc Test for Position:")
+    print(posthoc['position'])
+    print("\nPost-hoc for interaction (Treatment × Position):")
+    for pos, table in posthoc['interaction'].groupby('Position', sort=False, observed=True):
+        print(f"\nPosition: {pos}")
+        print(table.drop(columns='Position').reset_index(drop=True))
+
+
+def cmd_stats(args):
+    print_statistics(statistics(_stages(args), args.workers))
+
+
+def cmd_plots(args):
+    paths = build_targets(_stages(args), ['figures'], args.workers)
+    print(f"{len(paths)} figures regenerated in {args.outdir}")
+
+
+def cmd_report(args):
+    paths = build_targets(_stages(args), ['report'], args.workers)
+    print(f"Analysis complete ({len(paths)} outputs regenerated). "
+          f"Check the generated plots and the markdown and HTML reports in {args.outdir}")
+
+
+def cmd_basic(args):
+    stages = _stages(args)
+    build_targets(stages, ['basic'], args.workers)
+    print_basic(stages['anova'].value, stages['posthoc'].value)
+    print("Analysis complete. Check the generated plots.")
+
+
+def cmd_all(args):
+    paths = build_targets(_stages(args), ['basic', 'report'], args.workers)
+    print(f"Analysis complete ({len(paths)} outputs regenerated). "
+          f"Check the generated plots and the markdown and HTML reports in {args.outdir}")
+
+
+def cmd_batch(args):
+    from cfu.batch import SUMMARY_FILE, find_experiments, run_batch
+
+    csv_paths = find_experiments(args.inputs)
+    if not csv_paths:
+        raise SystemExit(f"no CSV files found in {' '.join(args.inputs)}")
+    summary = run_batch(csv_paths, args.outdir, args.workers, not args.no_cache, args.dpi, args.stats_only,
+                        args.n_resamples, args.seed, args.n_permutations, args.perm_precision,
+                        profile=args.profiler is not None, cprofile=args.cprofile)
+    failed = summary[summary['status'] == 'failed']
+    print(f"{len(summary) - len(failed)} of {len(summary)} experiments analysed; "
+          f"summary in {os.path.join(args.outdir, SUMMARY_FILE)}")
+    for experiment, error in failed[['experiment', 'error']].itertuples(index=False):
+        print(f"  FAILED {experiment}: {error}", file=sys.stderr)
+
+
+def cmd_ingest(args):
+    import pandas as pd
+
+    from cfu.online import STATE_FILE, OnlineStats
+
+    args.state = args.state or STATE_FILE
+    if args.reset and os.path.exists(args.state):
+        os.remove(args.state)
+    online = OnlineStats.resume(args.state)
+    added = online.ingest_file(args.csv)
+    online.save(args.state)
+    print(f"{added} new plates ingested, {online.n_plates} in total (state: {args.state})")
+    if not online.n_plates:
+        return
+    with pd.option_context('display.width', 120, 'display.max_columns', 20):
+        print("\nSummary Statistics:")
+        print(online.summary())
+        print("\nTwo-Way ANOVA Results:")
+        print(online.anova())
+        print("\nTukey's HSD Post-hoc Test for Treatment:")
+        print(online.tukey('Treatment'))
+        print("\nTukey's HSD Post-hoc Test for Position:")
+        print(online.tukey('Position'))
+        print("\nPost-hoc for interaction (Treatment × Position):")
+        print(online.tukey('Treatment', strata='Position'))
+
+
+def cmd_watch(args):
+    from cfu.watch import Watcher
+
+    watcher = Watcher(args.csv, args.outdir, None if args.no_cache else args.cache_dir, workers=args.workers,
+                      profiler=args.profiler, dpi=args.dpi, n_resamples=args.n_resamples, seed=args.seed,
+                      max_permutations=args.n_permutations, perm_precision=args.perm_precision)
+    print(f"watching {args.csv} (Ctrl-C to stop)")
+    try:
+        watcher.run(args.interval, args.debounce)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def cmd_power(args):
+    import pandas as pd
+
+    from cfu.power import power_grid, variance_components
+
+    components = variance_components(_stages(args)['cube'].value)
+    print(f"Variance components of {args.csv}: between replicates {components['replicate_var']:.4f}, "
+          f"between plates {components['plate_var']:.4f} (data: {components['n_replicates']} replicates x "
+          f"{components['n_plates']} plates per cell)")
+    grid = power_grid(components, args.replicates, args.plates, args.n_sims, args.alpha, args.effect_scale,
+                      args.seed, args.workers)
+    with pd.option_context('display.width', 120, 'display.max_columns', 20):
+        for analysis, table in grid.groupby('analysis', sort=False):
+            print(f"\nPower at alpha = {args.alpha:g}, ANOVA on {analysis} ({args.n_sims} simulated experiments "
+                  f"per design, effect scale {args.effect_scale:g}):")
+            print(table.drop(columns='analysis').to_string(index=False))
+    if args.output:
+        grid.to_csv(args.output, index=False)
+        print(f"\npower grid written to {args.output}")
+
+
+def cmd_render(args):
+    from cfu.report import SECTIONS, section_texts, write_report
+    from cfu.results import ResultsStore
+
+    # Only the stored tables are read; no statistics are recomputed
+    for outdir in args.experiments:
+        results = ResultsStore(os.path.join(outdir, RESULTS_DIR)).load_all()
+        paths = write_report([section_texts(name, results) for name in SECTIONS],
+                             os.path.join(outdir, REPORT_FILE), os.path.join(outdir, HTML_REPORT_FILE))
+        print(f"{' and '.join(paths)} rendered from {os.path.join(outdir, RESULTS_DIR)}")
+
+
+COMMANDS = {'stats': cmd_stats, 'plots': cmd_plots, 'report': cmd_report, 'basic': cmd_basic, 'all': cmd_all,
+            'batch': cmd_batch, 'ingest': cmd_ingest, 'watch': cmd_watch, 'power': cmd_power, 'render': cmd_render}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m cfu', description=__doc__.splitlines()[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--no-cache', action='store_true', help='recompute everything, persist nothing')
+    common.add_argument('--dpi', type=int, default=DPI, help='figure resolution')
+    common.add_argument('--workers', type=int, default=None, help='worker processes')
+    common.add_argument('--n-resamples', type=int, default=N_RESAMPLES, help='bootstrap resamples for efficacy CIs')
+    common.add_argument('--n-permutations', type=int, default=MAX_PERMUTATIONS,
+                        help='maximum permutations per ANOVA term')
+    common.add_argument('--perm-precision', type=float, default=PERM_PRECISION,
+                        help='stop permuting once the p-value 95%% interval is this narrow (half-width)')
+    common.add_argument('--seed', type=int, default=SEED, help='bootstrap and permutation random seed')
+    common.add_argument('--timings', action='store_true', help='print import and total time')
+    common.add_argument('--metrics', metavar='FILE', help='append timing metrics as a JSON line')
+    common.add_argument('--profile', action='store_true',
+                        help=f'record wall/CPU time and peak RSS of every stage and figure into {TRACE_FILE}')
+    common.add_argument('--cprofile', metavar='STAGE', action='append', default=[],
+                        help='also run STAGE (e.g. anova, posthoc, figure) under cProfile; implies --profile')
+
+    single = argparse.ArgumentParser(add_help=False, parents=[common])
+    single.add_argument('csv', nargs='?', default=DEFAULT_CSV, help='plate-count CSV (default: %(default)s)')
+    single.add_argument('--outdir', default='.', help='directory for figures and the report')
+    single.add_argument('--cache-dir', default='.cfu_cache', help='artifact cache directory')
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', parents=[single], help='summary statistics, assumptions, ANOVA and post-hoc tests')
+    subparsers.add_parser('plots', parents=[single], help='render the report figures')
+    subparsers.add_parser('report', parents=[single], help='figures plus the markdown and HTML reports')
+    subparsers.add_parser('basic', parents=[single],
+                          help='ANOVA and Tukey tables plus the three plots of the basic analysis')
+    subparsers.add_parser('all', parents=[single], help='basic and report outputs in one run')
+    ingest = subparsers.add_parser('ingest', parents=[single],
+                                   help='add new plates to running statistics and print the updated tables')
+    ingest.add_argument('--state', help='accumulator state file (default: .cfu_online.npz)')
+    ingest.add_argument('--reset', action='store_true', help='discard the saved state and start over')
+    watch = subparsers.add_parser('watch', parents=[single],
+                                  help='keep the libraries loaded and rebuild the report whenever the CSV '
+                                       '(or a CSV in the directory) changes')
+    watch.add_argument('--interval', type=float, default=0.5, help='seconds between polls (default: %(default)s)')
+    watch.add_argument('--debounce', type=float, default=1.0,
+                       help='seconds a file must be unchanged before it is analysed (default: %(default)s)')
+    power = subparsers.add_parser('power', parents=[single],
+                                  help='simulate the power of the ANOVA terms for a grid of replicate and plate '
+                                       'numbers, using the variance components of the CSV')
+    power.add_argument('--replicates', type=int, nargs='+', default=[2, 3, 4, 6, 8],
+                       help='replicates per treatment-position cell (default: %(default)s)')
+    power.add_argument('--plates', type=int, nargs='+', default=[3, 5, 10],
+                       help='plates per replicate (default: %(default)s)')
+    power.add_argument('--n-sims', type=int, default=2000,
+                       help='simulated experiments per design (default: %(default)s)')
+    power.add_argument('--alpha', type=float, default=0.05, help='significance level (default: %(default)s)')
+    power.add_argument('--effect-scale', type=float, default=1.0,
+                       help='scale the observed effects, e.g. 0.5 for effects half as large, 0 for none '
+                            '(default: %(default)s)')
+    power.add_argument('--output', metavar='FILE', help='also write the power grid as CSV')
+    render = subparsers.add_parser('render', parents=[common],
+                                   help='rewrite the markdown and HTML reports of earlier runs from their stored '
+                                        'results, without recomputing')
+    render.add_argument('experiments', nargs='+', metavar='OUTDIR', help='output directories of earlier runs')
+    render.set_defaults(outdir='.')
+    batch = subparsers.add_parser('batch', parents=[common], help='analyse many CSVs, one output directory each')
+    batch.add_argument('inputs', nargs='+', help='directories or glob patterns of plate-count CSVs')
+    batch.add_argument('--outdir', default='batch_results', help='root directory for per-experiment outputs')
+    batch.add_argument('--stats-only', action='store_true', help='skip figures and reports (results are still stored)')
+    return parser
+
+
+def main(argv=None):
+    start = time.perf_counter()
+    args = build_parser().parse_args(argv)
+    metrics = {'command': args.command}
+    os.makedirs(args.outdir, exist_ok=True)
+    args.profiler = None
+    if args.profile or args.cprofile:
+        args.profiler = Profiler(args.cprofile, profile_dir=os.path.join(args.outdir, PROFILE_DIR))
+    with import_timer(metrics):
+        COMMANDS[args.command](args)
+    metrics['total_seconds'] = time.perf_counter() - start
+
+    if args.profiler is not None and args.command != 'batch':
+        report_profile(args.profiler, os.path.join(args.outdir, TRACE_FILE), metrics)
+
+    if args.timings:
+        print(f"[{args.command}] imports {metrics['import_seconds']:.3f} s, "
+              f"total {metrics['total_seconds']:.3f} s", file=sys.stderr)
+    if args.metrics:
+        with open(args.metrics, 'a') as f:
+            f.write(json.dumps(metrics) + '\n')
+    return 0
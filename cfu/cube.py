@@ -0,0 +1,131 @@
+"""Dense Treatment x Position x Replicate x Plate array of the plate counts.
+
+The tidy frame is scattered once into a float array with one axis per
+design factor (levels integer coded in sorted order) and a boolean mask of
+the plates that were actually observed. Cell and marginal statistics are
+computed from that array on first use and then cached, so the summary
+table, the permutation test and every figure read the same numbers instead
+of each running its own groupby.
+"""
+
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+AXES = ('Treatment', 'Position', 'Replicate', 'Measurement')
+
+
+class ExperimentCube:
+    """Plate counts as values[treatment, position, replicate, plate] with a mask of observed plates."""
+
+    def __init__(self, values, mask, levels, dv='CFU', dtype=float):
+        self.values = values
+        self.mask = mask
+        self.levels = levels  # axis name -> level labels, in axis order
+        self.dv = dv
+        self.dtype = np.dtype(dtype)  # dtype of the original counts, kept by min and max
+
+    @classmethod
+    def from_tidy(cls, data, dv='CFU', axes=AXES):
+        """Scatter a tidy frame (one row per plate) into a cube; axes name its columns."""
+        codes, levels = [], {}
+        for axis in axes:
+            axis_codes, axis_levels = pd.factorize(data[axis], sort=True)
+            codes.append(axis_codes)
+            levels[axis] = np.asarray(axis_levels)
+        shape = tuple(len(level) for level in levels.values())
+        flat = np.ravel_multi_index(codes, shape)
+        if len(np.unique(flat)) != len(flat):
+            raise ValueError(f'duplicate rows for the same {" x ".join(axes)} cell')
+        values = np.full(shape, np.nan)
+        values.flat[flat] = data[dv].to_numpy(dtype=float)
+        # Blank plates (NaN counts) stay in the tidy frame but are not observations
+        mask = ~np.isnan(values)
+        return cls(values, mask, levels, dv, data[dv].dtype)
+
+    @property
+    def axes(self):
+        return list(self.levels)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    # Treatment x Position cell statistics, each an (n_treatments, n_positions) array
+
+    @cached_property
+    def count(self):
+        return self.mask.sum(axis=(2, 3))
+
+    @cached_property
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.mask, self.values, 0).sum(axis=(2, 3)) / self.count
+
+    @cached_property
+    def std(self):
+        dev = np.where(self.mask, self.values - self.mean[:, :, None, None], 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt((dev ** 2).sum(axis=(2, 3)) / (self.count - 1))
+
+    @cached_property
+    def sem(self):
+        return self.std / np.sqrt(self.count)
+
+    @cached_property
+    def cv(self):
+        return self.std / self.mean * 100
+
+    @cached_property
+    def min(self):
+        return self._in_dtype(np.where(self.mask, self.values, np.inf).min(axis=(2, 3)))
+
+    @cached_property
+    def max(self):
+        return self._in_dtype(np.where(self.mask, self.values, -np.inf).max(axis=(2, 3)))
+
+    def _in_dtype(self, extremes):
+        # Integer counts stay integers unless an empty cell needs a NaN
+        if self.dtype.kind in 'iu' and self.count.all():
+            return extremes.astype(self.dtype)
+        return np.where(self.count > 0, extremes, np.nan)
+
+    @cached_property
+    def replicate_means(self):
+        """Mean of every replicate, (n_treatments, n_positions, n_replicates); NaN where absent."""
+        n = self.mask.sum(axis=3)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.mask, self.values, 0).sum(axis=3) / n
+
+    @cached_property
+    def treatment_means(self):
+        """Unweighted mean of each treatment's position means."""
+        return self.mean.mean(axis=1)
+
+    @cached_property
+    def position_means(self):
+        """Unweighted mean of each position's treatment means."""
+        return self.mean.mean(axis=0)
+
+    def cells(self):
+        """Treatment and Position labels of the cells, in row-major (treatment-major) order."""
+        a, b = self.axes[:2]
+        return pd.DataFrame({
+            a: np.repeat(self.levels[a], len(self.levels[b])),
+            b: np.tile(self.levels[b], len(self.levels[a])),
+        })
+
+    def frame(self, stats=('count', 'mean', 'std', 'min', 'max', 'sem')):
+        """Long table of cell statistics, one row per Treatment x Position cell."""
+        table = self.cells()
+        for stat in stats:
+            table[stat] = getattr(self, stat).ravel()
+        return table
+
+    def table(self, stat='mean'):
+        """One cell statistic as a Position x Treatment frame (positions as rows)."""
+        a, b = self.axes[:2]
+        return pd.DataFrame(getattr(self, stat).T,
+                            index=pd.Index(self.levels[b], name=b),
+                            columns=pd.Index(self.levels[a], name=a))
@@ -0,0 +1,238 @@
+"""Poisson and negative-binomial GLMs for the Treatment x Position design.
+
+With a log link and only categorical predictors, the counts enter the
+score and the likelihood of a model only through the number of plates and
+the sum of the counts in each Treatment x Position cell. IRLS therefore
+runs on the cells instead of the plates, and a block of response columns
+is fitted at once as a stack of small weighted least-squares problems
+(one (p, p) system per column), so thousands of columns, or experiments
+sharing the design, cost about as much as one statsmodels fit.
+
+The negative-binomial (NB2, variance mu + alpha * mu^2) dispersion of each
+column is estimated by maximum likelihood under the full model, where the
+fitted means are the cell means, and then held fixed for the smaller
+models. Each term is tested with a likelihood-ratio test between nested
+models in the same order as the type II ANOVA: a main effect against the
+model with the other main effect only, the interaction against the
+additive model.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import special, stats
+
+from cfu.anova import factor_codes, term_names
+
+MAX_ITER = 100
+TOL = 1e-8
+CI = 95
+
+
+def design_matrix(n_a, n_b, terms=('A', 'B', 'AB'), ref_a=0, ref_b=0):
+    """Treatment-coded design matrix of the n_a * n_b cells (A-major order) for the given terms.
+
+    The intercept is always included; ref_a and ref_b are the reference
+    levels, which get no column of their own.
+    """
+    a = np.repeat(np.arange(n_a), n_b)
+    b = np.tile(np.arange(n_b), n_a)
+    A = (a[:, None] == np.delete(np.arange(n_a), ref_a)).astype(float)
+    B = (b[:, None] == np.delete(np.arange(n_b), ref_b)).astype(float)
+    blocks = {'A': A, 'B': B, 'AB': (A[:, :, None] * B[:, None, :]).reshape(len(a), -1)}
+    return np.hstack([np.ones((len(a), 1))] + [blocks[term] for term in terms])
+
+
+def cell_totals(Y, cell, n_cells):
+    """Observed plates and count totals per cell for every column of Y (NaNs are not observed).
+
+    Both arrays are (n_cells, n_responses).
+    """
+    observed = ~np.isnan(Y)
+    order = np.argsort(cell, kind='stable')
+    counts = np.bincount(cell, minlength=n_cells)
+    present = np.flatnonzero(counts)
+    starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+    n = np.zeros((n_cells, Y.shape[1]))
+    S = np.zeros((n_cells, Y.shape[1]))
+    n[present] = np.add.reduceat(observed[order], starts, axis=0)
+    S[present] = np.add.reduceat(np.where(observed, Y, 0)[order], starts, axis=0)
+    return n, S
+
+
+def fit_log_linear(X, n, S, alpha, max_iter=MAX_ITER, tol=TOL):
+    """IRLS fit of a log-link Poisson (alpha = 0) or NB2 model to cell totals, all columns at once.
+
+    X is (n_cells, p); n and S are (n_cells, k); alpha is (k,). Returns the
+    fitted cell means (n_cells, k), coefficients (k, p) and their covariance
+    (k, p, p). Cells without plates get zero weight.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ybar = np.where(n > 0, S / n, 0)
+        overall = S.sum(axis=0) / n.sum(axis=0)
+    mu = np.maximum((ybar + overall) / 2, TOL)
+    eta = np.log(mu)
+    for _ in range(max_iter):
+        w = n * mu / (1 + alpha * mu)
+        z = eta + (ybar - mu) / mu
+        XtW = X.T[None] * w.T[:, None, :]
+        cov = np.linalg.pinv(XtW @ X)
+        coef = (cov @ (XtW @ z.T[:, :, None]))[:, :, 0]
+        eta_new = (coef @ X.T).T
+        change = np.abs(np.where(n > 0, eta_new - eta, 0)).max()
+        eta = eta_new
+        mu = np.exp(eta)
+        if change < tol:
+            break
+    return mu, coef, cov
+
+
+def log_likelihood(n, S, mu, alpha):
+    """Log-likelihood of every column from cell totals, without the terms that cancel in LR tests.
+
+    Those terms depend only on the data and alpha, so models compared with
+    the same alpha can be compared with this.
+    """
+    poisson = special.xlogy(S, mu) - n * mu
+    r = 1 / np.where(alpha > 0, alpha, 1)
+    negbin = special.xlogy(S, mu / (r + mu)) + n * r * np.log(r / (r + mu))
+    return np.where(alpha > 0, negbin, poisson).sum(axis=0)
+
+
+def nb_dispersion(Y, mu, max_iter=MAX_ITER, tol=TOL):
+    """Maximum-likelihood NB2 dispersion alpha of every column of Y given its fitted means.
+
+    Y and mu are (n_obs, k); NaN values of Y are ignored. Columns that are
+    not overdispersed get alpha = 0 (the Poisson model).
+    """
+    observed = ~np.isnan(Y)
+    y = np.where(observed, Y, 0)
+    mu = np.where(observed, mu, 1)
+
+    # Moment estimate as the starting point; Newton steps on log(1 / alpha) from there
+    with np.errstate(invalid='ignore', divide='ignore'):
+        alpha = (observed * ((y - mu) ** 2 - y)).sum(axis=0) / (observed * mu ** 2).sum(axis=0)
+    over = alpha > 0
+    log_r = -np.log(np.where(over, alpha, 1))
+    for _ in range(max_iter):
+        r = np.exp(log_r)
+        score = (observed * (special.digamma(y + r) - special.digamma(r) + np.log(r / (r + mu))
+                             + (mu - y) / (r + mu))).sum(axis=0)
+        hess = (observed * (special.polygamma(1, y + r) - special.polygamma(1, r) + 1 / r
+                            + (y - r - 2 * mu) / (r + mu) ** 2)).sum(axis=0)
+        grad, curvature = r * score, r * score + r * r * hess
+        # Newton where the likelihood is concave in log r, otherwise a bounded step uphill
+        with np.errstate(invalid='ignore', divide='ignore'):
+            step = np.where(curvature < 0, -grad / curvature, np.sign(grad))
+        step = np.where(over, np.clip(step, -1, 1), 0)
+        log_r += step
+        if np.abs(step).max(initial=0) < tol:
+            break
+    return np.where(over, np.exp(-log_r), 0.0)
+
+
+def lr_table(ll, ranks, index):
+    """Likelihood-ratio tests of the three terms from nested-model log-likelihoods and ranks.
+
+    ll and ranks map 'A', 'B', 'A+B' and 'A*B' to per-column arrays; returns
+    one table per column.
+    """
+    pairs = [('A+B', 'B'), ('A+B', 'A'), ('A*B', 'A+B')]
+    LR = np.array([2 * (ll[big] - ll[small]) for big, small in pairs]).clip(0)
+    df = np.array([ranks[big] - ranks[small] for big, small in pairs], dtype=float)
+    with np.errstate(invalid='ignore'):
+        p = np.where(df > 0, stats.chi2.sf(LR, np.maximum(df, 1)), np.nan)
+    return [pd.DataFrame({'LR': LR[:, j], 'df': df[:, j], 'PR(>Chi2)': p[:, j]}, index=index)
+            for j in range(LR.shape[1])]
+
+
+def rate_ratio_frame(log_rr, se, ci):
+    """Rate ratio, its Wald interval and the matching efficacy (% reduction) as columns."""
+    z = stats.norm.ppf(0.5 + ci / 200)
+    return {
+        'rate_ratio': np.exp(log_rr),
+        'ci_low': np.exp(log_rr - z * se),
+        'ci_high': np.exp(log_rr + z * se),
+        'efficacy': (1 - np.exp(log_rr)) * 100,
+    }
+
+
+def count_models(data, dvs, factor_a='Treatment', factor_b='Position', control='Control', ci=CI):
+    """Poisson and negative-binomial two-way GLMs for several count columns in one call.
+
+    Returns a dict mapping each column in dvs to a dict with:
+      poisson, negbin  likelihood-ratio test of each term (LR, df, PR(>Chi2))
+      alpha            NB2 dispersion (0 when the counts are not overdispersed)
+      dispersion       Pearson chi2 / df of the full Poisson model (1 for Poisson counts)
+      by_position      rate ratio of each treatment to the control within each level of factor_b
+      overall          rate ratio of each treatment to the control from the additive NB model
+    Rate ratios come with Wald intervals (ci %) and efficacy = (1 - ratio) * 100.
+    """
+    dvs = list(dvs)
+    a_codes, n_a = factor_codes(data, factor_a)
+    b_codes, n_b = factor_codes(data, factor_b)
+    a_levels = np.asarray(pd.factorize(data[factor_a], sort=True)[1])
+    b_levels = np.asarray(pd.factorize(data[factor_b], sort=True)[1])
+    c = list(a_levels).index(control)
+    Y = data[dvs].to_numpy(dtype=float)
+    if (Y < 0).any():
+        raise ValueError('count models need non-negative counts')
+
+    cell = a_codes * n_b + b_codes
+    n, S = cell_totals(Y, cell, n_a * n_b)
+    present = n > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cell_means = np.where(present, S / n, np.nan)
+    full = np.where(present, cell_means, 0)
+    alpha = nb_dispersion(Y, full[cell])
+    k = len(dvs)
+    poisson_alpha = np.zeros(k)
+
+    # Nested models on the cells; the full model is saturated, so its fitted means are the cell means
+    designs = {'A': ('A',), 'B': ('B',), 'A+B': ('A', 'B')}
+    ranks = {'A*B': present.sum(axis=0)}
+    ll = {'poisson': {'A*B': log_likelihood(n, S, full, poisson_alpha)},
+          'negbin': {'A*B': log_likelihood(n, S, full, alpha)}}
+    for name, terms in designs.items():
+        X = design_matrix(n_a, n_b, terms, ref_a=c)
+        ranks[name] = np.linalg.matrix_rank(X[None] * present.T[:, :, None])
+        for family, family_alpha in (('poisson', poisson_alpha), ('negbin', alpha)):
+            mu, coef, cov = fit_log_linear(X, n, S, family_alpha)
+            ll[family][name] = log_likelihood(n, S, mu, family_alpha)
+            if family == 'negbin' and name == 'A+B':
+                additive_coef, additive_cov = coef, cov
+    index = term_names(factor_a, factor_b)[:3]
+    poisson = lr_table(ll['poisson'], ranks, index)
+    negbin = lr_table(ll['negbin'], ranks, index)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dispersion = np.nansum((Y - full[cell]) ** 2 / full[cell], axis=0) / (n.sum(axis=0) - ranks['A*B'])
+        # Within each level of factor_b: ratio of cell means, var(log mean) = (1 + alpha * mu) / (n * mu)
+        log_means = np.log(cell_means).reshape(n_a, n_b, k)
+        var_log = ((1 + alpha * cell_means) / (n * cell_means)).reshape(n_a, n_b, k)
+    others = np.delete(np.arange(n_a), c)
+    by_position = rate_ratio_frame(log_means[others] - log_means[c], np.sqrt(var_log[others] + var_log[c]), ci)
+    overall = rate_ratio_frame(additive_coef[:, 1:n_a].T, np.sqrt(np.diagonal(additive_cov, axis1=1, axis2=2)
+                                                                  [:, 1:n_a].T), ci)
+
+    results = {}
+    for j, dv in enumerate(dvs):
+        results[dv] = {
+            'poisson': poisson[j],
+            'negbin': negbin[j],
+            'alpha': alpha[j],
+            'dispersion': dispersion[j],
+            'by_position': pd.DataFrame({
+                factor_a: np.repeat(a_levels[others], n_b),
+                factor_b: np.tile(b_levels, len(others)),
+                **{col: values[:, :, j].ravel() for col, values in by_position.items()},
+            }),
+            'overall': pd.DataFrame({factor_a: a_levels[others],
+                                     **{col: values[:, j] for col, values in overall.items()}}),
+            'ci': ci,
+        }
+    return results
+
+
+def count_model(data, dv='CFU', factor_a='Treatment', factor_b='Position', control='Control', ci=CI):
+    """Poisson and negative-binomial GLM results for one count column (see count_models)."""
+    return count_models(data, [dv], factor_a, factor_b, control, ci)[dv]
@@ -0,0 +1,121 @@
+"""Read plate-reader exports into the tidy one-row-per-plate frame.
+
+Position and Treatment are categoricals whose category order follows the
+label maps (Top/Middle/Bottom, Control first), and the replicate, plate and
+count columns use the narrowest unsigned integer type that holds them, so a
+large run costs a few bytes per plate instead of several Python strings.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Sample IDs look like 'Tcon1' or 'Mpb12': position letter, treatment code, replicate number
+DEFAULT_ID_PATTERN = r'^(?P<Position>[A-Za-z])(?P<Treatment>[A-Za-z]+)(?P<Replicate>\d+)$'
+
+# Map positions and treatments to more readable labels
+POSITION_MAP = {'T': 'Top', 'M': 'Middle', 'B': 'Bottom'}
+TREATMENT_MAP = {'con': 'Control', 'bot': 'Botector', 'pb': 'Potassium Bicarbonate'}
+
+# Column order of the tidy frame
+TIDY_COLUMNS = ['Position', 'Treatment', 'Replicate', 'Measurement', 'CFU']
+
+
+def narrow_unsigned(values):
+    """Cast whole non-negative numbers to the smallest unsigned dtype; anything else is returned as is."""
+    values = np.asarray(values)
+    if values.size == 0 or values.dtype.kind not in 'iuf':
+        return values
+    if values.dtype.kind == 'f' and not (np.isfinite(values).all() and (values == np.round(values)).all()):
+        return values
+    if values.min() < 0:
+        return values
+    return values.astype(np.min_scalar_type(int(values.max())))
+
+
+def categorical_labels(codes, mapping):
+    """Map raw codes to a categorical of readable labels, categories in mapping order."""
+    return pd.Categorical(codes.map(mapping), categories=list(dict.fromkeys(mapping.values())))
+
+
+def plate_columns(df):
+    """Return the columns holding plate counts (headers that are plain integers)."""
+    return [col for col in df.columns if str(col).strip().isdigit()]
+
+
+def group_codes(data, factors=('Treatment', 'Position')):
+    """Composite categorical of the factors' category combinations, built from their integer codes."""
+    codes = np.zeros(len(data), dtype=np.int64)
+    names = ['']
+    for factor in factors:
+        column = data[factor].cat
+        codes = codes * len(column.categories) + column.codes
+        names = [f'{name}_{level}' if name else str(level) for name in names for level in column.categories]
+    return pd.Categorical.from_codes(codes, categories=names)
+
+
+def check_average(wide, plates, average_col='average', tolerance=0.05):
+    """Raise ValueError when the exported average disagrees with the plate counts."""
+    if average_col not in wide.columns:
+        return
+    reported = pd.to_numeric(wide[average_col], errors='coerce').to_numpy()
+    computed = wide[plates].to_numpy(dtype=float).mean(axis=1)
+    bad = ~np.isnan(reported) & ~np.isclose(computed, reported, rtol=0, atol=tolerance)
+    if bad.any():
+        raise ValueError(f"'{average_col}' column does not match the plate counts for: "
+                         f"{', '.join(wide.index[bad].astype(str))}")
+
+
+def parse_sample_ids(ids, id_pattern=DEFAULT_ID_PATTERN,
+                     position_map=POSITION_MAP, treatment_map=TREATMENT_MAP):
+    """Split sample IDs into Position, Treatment and Replicate columns in one pass."""
+    parts = pd.Series(ids, dtype=str).str.extract(id_pattern)
+    unparsed = parts.isna().any(axis=1).to_numpy()
+    if unparsed.any():
+        raise ValueError(f"Sample IDs do not match {id_pattern!r}: "
+                         f"{', '.join(np.asarray(ids)[unparsed].astype(str))}")
+
+    parsed = pd.DataFrame({
+        'Position': categorical_labels(parts['Position'], position_map),
+        'Treatment': categorical_labels(parts['Treatment'], treatment_map),
+        'Replicate': narrow_unsigned(parts['Replicate'].astype(int).to_numpy()),
+    })
+    for col, raw in (('Position', parts['Position']), ('Treatment', parts['Treatment'])):
+        unknown = parsed[col].isna().to_numpy()
+        if unknown.any():
+            raise ValueError(f"Unknown {col.lower()} codes: {', '.join(sorted(raw[unknown].unique()))}")
+    return parsed
+
+
+def load_plate_counts(path, id_pattern=DEFAULT_ID_PATTERN, position_map=POSITION_MAP,
+                      treatment_map=TREATMENT_MAP, validate_average=True):
+    """Read a plate-count CSV and return the tidy frame.
+
+    The first column holds the sample IDs, columns headed 1..n the plate
+    counts. The 'average' column is checked against the counts (or ignored
+    when validate_average is False) and the free-text notes in the trailing
+    columns are dropped.
+    """
+    df = pd.read_csv(path, index_col=0)
+    df = df[df.index.notna()]
+    plates = plate_columns(df)
+    if not plates:
+        raise ValueError(f'{path}: no plate-count columns found')
+    if validate_average:
+        check_average(df, plates)
+
+    ids = parse_sample_ids(df.index, id_pattern, position_map, treatment_map)
+    counts = df[plates].to_numpy()
+    n_samples, n_plates = counts.shape
+    sample = np.repeat(np.arange(n_samples), n_plates)
+
+    # Same result as melt over the plate columns, but row-major so each
+    # sample's plates stay together in the original file order; categoricals
+    # are expanded through their codes, never through the label strings
+    tidy_df = pd.DataFrame({
+        'Position': ids['Position'].iloc[sample].reset_index(drop=True),
+        'Treatment': ids['Treatment'].iloc[sample].reset_index(drop=True),
+        'Replicate': ids['Replicate'].to_numpy()[sample],
+        'Measurement': np.tile(narrow_unsigned([int(col) for col in plates]), n_samples),
+        'CFU': narrow_unsigned(counts.ravel()),
+    }, columns=TIDY_COLUMNS)
+    return tidy_df
@@ -0,0 +1,243 @@
+"""Rank-based alternatives to the two-way ANOVA and the Tukey tests.
+
+The aligned rank transform (ART, Wobbrock et al. 2011) removes every effect
+except the one under test from the data, ranks what is left and runs the
+usual factorial ANOVA on those ranks, keeping only that effect's row. The
+three alignments of every response column are stacked into one array, so
+one sort and one sums-of-squares pass cover the whole block;
+balanced designs reuse the closed-form sums of squares of cfu.anova and
+unbalanced ones the cell-statistics path, so statsmodels is never needed.
+
+Within each stratum (position), treatments are compared with the
+Kruskal-Wallis test and Dunn's pairwise z-tests, Holm-corrected per
+stratum. The within-stratum ranks of all strata come from a single sort.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from cfu.anova import (balanced_sums_of_squares, cell_counts, cell_sums_of_squares, factor_codes,
+                       is_balanced, term_names)
+
+# Aligned values are sums of means; rounding keeps exact ties tied despite floating-point error
+ALIGN_DECIMALS = 9
+
+
+def group_moments(Y, codes, n_groups):
+    """Count, mean and sum of squared deviations of every column of Y per group code.
+
+    Y is (n_obs, n_responses); means and M2 come back as (n_groups, n_responses)
+    arrays, with NaN means and zero M2 for groups without observations.
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    order = np.argsort(codes, kind='stable')
+    present = np.flatnonzero(counts)
+    starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+    means = np.full((n_groups, Y.shape[1]), np.nan)
+    means[present] = np.add.reduceat(Y[order], starts, axis=0) / counts[present, None]
+    m2 = np.zeros_like(means)
+    m2[present] = np.add.reduceat((Y[order] - means[codes[order]]) ** 2, starts, axis=0)
+    return counts, means, m2
+
+
+def aligned_responses(Y, a_codes, b_codes, n_a, n_b):
+    """The ART alignments of every column of Y, stacked as (n_obs, 3 * n_responses).
+
+    The columns come in three blocks of n_responses: aligned for the A main
+    effect, for the B main effect and for the A:B interaction.
+    """
+    cell = a_codes * n_b + b_codes
+    counts, cell_means, _ = group_moments(Y, cell, n_a * n_b)
+
+    # Marginal means of the observations, weighted up from the cell means
+    sums = (counts[:, None] * np.nan_to_num(cell_means)).reshape(n_a, n_b, -1)
+    counts = counts.reshape(n_a, n_b, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a_means = sums.sum(axis=1) / counts.sum(axis=1)
+        b_means = sums.sum(axis=0) / counts.sum(axis=0)
+    grand = Y.mean(axis=0)
+    residual = Y - cell_means[cell]
+    effects = [
+        a_means[a_codes] - grand,
+        b_means[b_codes] - grand,
+        cell_means[cell] - a_means[a_codes] - b_means[b_codes] + grand,
+    ]
+    return np.round(np.hstack([residual + effect for effect in effects]), ALIGN_DECIMALS)
+
+
+def average_ranks(X):
+    """Ranks of each column of X with ties given their average rank (rankdata(X, axis=0))."""
+    X = np.ascontiguousarray(X.T)
+    order = np.argsort(X, axis=1)
+    X_sorted = np.take_along_axis(X, order, axis=1)
+    n = X.shape[1]
+
+    # Every value in a run of ties gets the mean of the run's first and last position
+    first = np.ones(X.shape, dtype=bool)
+    first[:, 1:] = X_sorted[:, 1:] != X_sorted[:, :-1]
+    last = np.ones(X.shape, dtype=bool)
+    last[:, :-1] = first[:, 1:]
+    position = np.arange(n)
+    start = np.maximum.accumulate(np.where(first, position, 0), axis=1)
+    end = np.minimum.accumulate(np.where(last, position, n)[:, ::-1], axis=1)[:, ::-1]
+    ranks = np.empty(X.shape)
+    np.put_along_axis(ranks, order, (start + end) / 2 + 1, axis=1)
+    return ranks.T
+
+
+def art_sums_of_squares(Y, a_codes, b_codes, n_a, n_b):
+    """Effect and residual sums of squares and df of the ART, each (3, n_responses).
+
+    Row t of every array belongs to term t (A, B, A:B), taken from the ANOVA
+    of the ranks aligned for that term. Y must not contain NaNs.
+    """
+    k = Y.shape[1]
+    ranks = average_ranks(aligned_responses(Y, a_codes, b_codes, n_a, n_b))
+    counts = cell_counts(a_codes, b_codes, n_a, n_b)
+    if is_balanced(counts):
+        sum_sq, df = balanced_sums_of_squares(ranks, a_codes, b_codes, n_a, n_b)
+        df = np.repeat(df[:, None], 3 * k, axis=1)
+    else:
+        _, means, m2 = group_moments(ranks, a_codes * n_b + b_codes, n_a * n_b)
+        columns = [cell_sums_of_squares(counts, means[:, j].reshape(n_a, n_b), m2[:, j].reshape(n_a, n_b))
+                   for j in range(3 * k)]
+        sum_sq = np.hstack([col_sum_sq for col_sum_sq, _ in columns])
+        df = np.column_stack([col_df for _, col_df in columns])
+
+    # Each block keeps the row of its own term
+    term = np.repeat(np.arange(3), k)
+    column = np.arange(3 * k)
+    return (sum_sq[term, column].reshape(3, k), df[term, column].reshape(3, k),
+            sum_sq[3].reshape(3, k), df[3].reshape(3, k))
+
+
+def art_table(sum_sq, df, resid_sum_sq, resid_df, index):
+    """ANOVA-style table of one response's ART terms."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        F = (sum_sq / df) / (resid_sum_sq / resid_df)
+    return pd.DataFrame({
+        'sum_sq': sum_sq,
+        'df': df,
+        'df_resid': resid_df,
+        'F': F,
+        'PR(>F)': stats.f.sf(F, df, resid_df),
+    }, index=index)
+
+
+def aligned_rank_anovas(data, dvs, factor_a='Treatment', factor_b='Position'):
+    """Two-way ART ANOVA tables for several response columns in one call.
+
+    Returns a dict mapping each column in dvs to a table with one row per
+    term (named as in the ANOVA tables) and its own residual df. Columns
+    without missing values are analysed together; a column with missing
+    values is analysed on its own observed rows.
+    """
+    dvs = list(dvs)
+    a_codes, n_a = factor_codes(data, factor_a)
+    b_codes, n_b = factor_codes(data, factor_b)
+    index = term_names(factor_a, factor_b)[:3]
+
+    Y = data[dvs].to_numpy(dtype=float)
+    missing = np.isnan(Y)
+    blocks = [(np.flatnonzero(~missing.any(axis=0)), np.ones(len(Y), dtype=bool))]
+    blocks += [([j], ~missing[:, j]) for j in np.flatnonzero(missing.any(axis=0))]
+    tables = {}
+    for columns, rows in blocks:
+        if not len(columns):
+            continue
+        terms = art_sums_of_squares(Y[rows][:, columns], a_codes[rows], b_codes[rows], n_a, n_b)
+        for i, j in enumerate(columns):
+            tables[dvs[j]] = art_table(*(arr[:, i] for arr in terms), index)
+    return {dv: tables[dv] for dv in dvs}
+
+
+def aligned_rank_anova(data, dv='CFU', factor_a='Treatment', factor_b='Position'):
+    """Two-way ART ANOVA table of one response column."""
+    return aligned_rank_anovas(data, [dv], factor_a, factor_b)[dv]
+
+
+def stratum_ranks(y, strata, n_strata):
+    """Average ranks of y within each stratum code, and the tie term sum(t^3 - t) per stratum."""
+    order = np.lexsort((y, strata))
+    y_sorted, s_sorted = y[order], strata[order]
+    first = np.ones(len(y), dtype=bool)
+    first[1:] = (y_sorted[1:] != y_sorted[:-1]) | (s_sorted[1:] != s_sorted[:-1])
+    run = np.cumsum(first) - 1
+
+    # 1-based position within the stratum, averaged over each run of tied values
+    counts = np.bincount(strata, minlength=n_strata)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    position = np.arange(1, len(y) + 1) - starts[s_sorted]
+    run_length = np.bincount(run).astype(float)
+    ranks = np.empty(len(y))
+    ranks[order] = (np.bincount(run, weights=position) / run_length)[run]
+    ties = np.bincount(s_sorted[first], weights=run_length ** 3 - run_length, minlength=n_strata)
+    return ranks, ties
+
+
+def holm(p):
+    """Holm-adjusted p-values along the last axis; NaNs are left out of each family."""
+    order = np.argsort(p, axis=-1)
+    sorted_p = np.take_along_axis(p, order, axis=-1)
+    m = (~np.isnan(p)).sum(axis=-1, keepdims=True)
+    adjusted = np.maximum.accumulate(np.minimum(sorted_p * (m - np.arange(p.shape[-1])), 1), axis=-1)
+    result = np.empty_like(adjusted)
+    np.put_along_axis(result, order, adjusted, axis=-1)
+    return result
+
+
+def kruskal_dunn(data, dv='CFU', between='Treatment', strata=None):
+    """Kruskal-Wallis test and Dunn's pairwise tests between the levels of `between`, per stratum.
+
+    Returns (kruskal, dunn). kruskal has one row per stratum (n, H, df,
+    p-unc); dunn has one row per pair of levels within a stratum (A, B,
+    mean rank(A), mean rank(B), z, p-unc, p-holm). Both use tie-corrected
+    variances and ranks within the stratum; strata (a column name or None)
+    are in order of first appearance, levels in sorted (or category) order.
+    """
+    if strata is None:
+        s_codes, s_levels = np.zeros(len(data), dtype=np.intp), np.array([None])
+    else:
+        s_codes, s_levels = pd.factorize(data[strata])
+    g_codes, g_levels = pd.factorize(data[between], sort=True)
+    y = data[dv].to_numpy(dtype=float)
+    keep = (s_codes >= 0) & (g_codes >= 0) & ~np.isnan(y)
+    s_codes, g_codes, y = s_codes[keep], g_codes[keep], y[keep]
+    n_s, n_g = len(s_levels), len(g_levels)
+
+    ranks, ties = stratum_ranks(y, s_codes, n_s)
+    cell = s_codes * n_g + g_codes
+    counts = np.bincount(cell, minlength=n_s * n_g).reshape(n_s, n_g)
+    N = counts.sum(axis=1).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_ranks = np.bincount(cell, weights=ranks, minlength=n_s * n_g).reshape(n_s, n_g) / counts
+        tie_correction = 1 - ties / (N ** 3 - N)
+        H = (12 / (N * (N + 1)) * np.nansum(counts * mean_ranks ** 2, axis=1) - 3 * (N + 1)) / tie_correction
+    df = (counts > 0).sum(axis=1) - 1
+    kruskal = pd.DataFrame({'n': N.astype(int), 'H': H, 'df': df,
+                            'p-unc': np.where(df > 0, stats.chi2.sf(H, np.maximum(df, 1)), np.nan)})
+
+    # Dunn's z for every pair of levels present in a stratum
+    i, j = np.triu_indices(n_g, 1)
+    s, pair = np.nonzero((counts[:, i] > 0) & (counts[:, j] > 0))
+    a, b = i[pair], j[pair]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = N * (N + 1) / 12 - ties / (12 * (N - 1))
+        z = (mean_ranks[s, a] - mean_ranks[s, b]) / np.sqrt(variance[s] * (1 / counts[s, a] + 1 / counts[s, b]))
+    p = 2 * stats.norm.sf(np.abs(z))
+    family = np.full((n_s, len(i)), np.nan)
+    family[s, pair] = p
+    dunn = pd.DataFrame({
+        'A': np.asarray(g_levels)[a],
+        'B': np.asarray(g_levels)[b],
+        'mean rank(A)': mean_ranks[s, a],
+        'mean rank(B)': mean_ranks[s, b],
+        'z': z,
+        'p-unc': p,
+        'p-holm': holm(family)[s, pair],
+    })
+    if strata is not None:
+        kruskal.insert(0, strata, np.asarray(s_levels))
+        dunn[strata] = np.asarray(s_levels)[s]
+    return kruskal, dunn
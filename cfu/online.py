@@ -0,0 +1,234 @@
+"""Running statistics that absorb new plate counts without recomputing everything.
+
+OnlineStats keeps Welford accumulators (count, mean and M2, the sum of
+squared deviations) plus min and max for every Treatment x Position x
+Replicate cell. A batch of new plates is folded in with the parallel form
+of Welford's update (Chan et al.), touching only the cells that received
+data. The summary table, efficacy, the two-way ANOVA sums of squares and
+the Tukey inputs are all derived from the accumulators.
+
+To know which plates were already ingested, the state also holds one slot
+per plate position of the design (treatment x position x replicate x plate
+number) with the count ingested there, NaN while it is empty. Incoming rows
+index their slots directly, so an update costs O(new rows) whatever the
+number of plates ingested so far. The slots are kept only to detect edits:
+accumulators can add values but not take them back, so a plate whose count
+changed after it was ingested is reported and the state has to be rebuilt.
+They make the saved state as large as the plate grid of the design (the
+size of the experiment cube), which is still independent of how often and
+in how many pieces the export is re-read.
+
+The state is saved to a single .npz file, so re-reading a growing export
+after a restart only adds the plates that are new.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from cfu.anova import anova_from_sums_of_squares, cell_sums_of_squares, term_names
+from cfu.loader import load_plate_counts
+from cfu.posthoc import tukey_from_moments
+
+STATE_FILE = '.cfu_online.npz'
+FACTORS = ('Treatment', 'Position', 'Replicate')
+
+
+def _levels_of(column):
+    """Levels of a column in the order the rest of the package uses (category order, else sorted)."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return list(column.cat.categories)
+    return sorted(pd.unique(column.dropna()))
+
+
+class OnlineStats:
+    """Per-cell Welford accumulators for the Treatment x Position x Replicate design."""
+
+    def __init__(self, dv='CFU', control='Control'):
+        self.dv = dv
+        self.control = control
+        self.levels = {factor: [] for factor in FACTORS}
+        shape = (0, 0, 0)
+        self.n = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.zeros(shape)
+        self.max = np.zeros(shape)
+        # Count ingested at each Treatment x Position x Replicate x plate number, NaN where none yet
+        self.plates = np.full(shape + (0,), np.nan)
+
+    @property
+    def n_plates(self):
+        return int(self.n.sum())
+
+    def _codes(self, data):
+        """Integer codes of the rows' factor levels, adding unseen levels (and growing the arrays)."""
+        codes = []
+        for factor in FACTORS:
+            known = self.levels[factor]
+            new = [level for level in _levels_of(data[factor]) if level not in known]
+            known.extend(new)
+            codes.append(pd.Index(known).get_indexer(data[factor]))
+        shape = tuple(len(self.levels[factor]) for factor in FACTORS)
+        if shape != self.n.shape:
+            pad = [(0, new - old) for new, old in zip(shape, self.n.shape)]
+            self.n = np.pad(self.n, pad)
+            self.mean = np.pad(self.mean, pad)
+            self.m2 = np.pad(self.m2, pad)
+            self.min = np.pad(self.min, pad, constant_values=np.inf)
+            self.max = np.pad(self.max, pad, constant_values=-np.inf)
+            self.plates = np.pad(self.plates, pad + [(0, 0)], constant_values=np.nan)
+        return codes
+
+    def update(self, data):
+        """Fold new tidy rows (one per plate) into the accumulators; cost is O(len(data))."""
+        y = data[self.dv].to_numpy(dtype=float)
+        keep = ~np.isnan(y)
+        data, y = data[keep], y[keep]
+        if not len(y):
+            return 0
+        cell = np.ravel_multi_index(self._codes(data), self.n.shape)
+
+        # Statistics of the batch per touched cell, then Chan's merge with the running ones
+        touched, inverse = np.unique(cell, return_inverse=True)
+        n_b = np.bincount(inverse)
+        mean_b = np.bincount(inverse, weights=y) / n_b
+        m2_b = np.bincount(inverse, weights=(y - mean_b[inverse]) ** 2)
+
+        n_a = self.n.flat[touched]
+        total = n_a + n_b
+        delta = mean_b - self.mean.flat[touched]
+        self.mean.flat[touched] += delta * n_b / total
+        self.m2.flat[touched] += m2_b + delta ** 2 * n_a * n_b / total
+        self.n.flat[touched] = total
+        lo, hi = np.full(len(touched), np.inf), np.full(len(touched), -np.inf)
+        np.minimum.at(lo, inverse, y)
+        np.maximum.at(hi, inverse, y)
+        self.min.flat[touched] = np.minimum(self.min.flat[touched], lo)
+        self.max.flat[touched] = np.maximum(self.max.flat[touched], hi)
+        return len(y)
+
+    def ingest(self, data):
+        """Add the plates of a tidy frame that were not ingested before; returns how many were new.
+
+        Raises ValueError if an already ingested plate now has a different count.
+        """
+        data = data[data[self.dv].notna()]
+        slots = tuple(self._codes(data)) + (data['Measurement'].to_numpy(dtype=np.int64),)
+        values = data[self.dv].to_numpy(dtype=float)
+        if len(values) and slots[3].max() >= self.plates.shape[3]:
+            grow = slots[3].max() + 1 - self.plates.shape[3]
+            self.plates = np.pad(self.plates, [(0, 0)] * 3 + [(0, grow)], constant_values=np.nan)
+
+        previous = self.plates[slots]
+        seen = ~np.isnan(previous)
+        changed = seen & (previous != values)
+        if changed.any():
+            rows = data[changed][list(FACTORS) + ['Measurement']].astype(str).agg(' '.join, axis=1)
+            raise ValueError(f"{changed.sum()} ingested plate(s) changed since they were added "
+                             f"(e.g. {rows.iloc[0]}); rebuild the state with --reset")
+
+        new = ~seen
+        added = self.update(data[new])
+        self.plates[tuple(codes[new] for codes in slots)] = values[new]
+        return added
+
+    def ingest_file(self, path, **loader_options):
+        """Ingest the new plates of a plate-count CSV (blank plate cells are skipped)."""
+        loader_options.setdefault('validate_average', False)
+        return self.ingest(load_plate_counts(path, **loader_options))
+
+    # Results derived from the accumulators
+
+    def cells(self):
+        """Count, mean and M2 per Treatment x Position cell, pooled over replicates."""
+        n = self.n.sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (self.n * self.mean).sum(axis=2) / n
+        dev = np.where(self.n > 0, self.mean - np.nan_to_num(mean)[:, :, None], 0)
+        m2 = self.m2.sum(axis=2) + (self.n * dev ** 2).sum(axis=2)
+        return n, mean, m2
+
+    def summary(self):
+        """The summary statistics table (same columns as the pipeline's summary stage)."""
+        n, mean, m2 = self.cells()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(m2 / (n - 1))
+            control = self.levels['Treatment'].index(self.control)
+            efficacy = (mean[control] - mean) / mean[control] * 100
+        efficacy[control] = np.nan
+        n_t, n_p = n.shape
+        table = pd.DataFrame({
+            'Treatment': np.repeat(self.levels['Treatment'], n_p),
+            'Position': np.tile(self.levels['Position'], n_t),
+            'count': n.ravel(),
+            'mean': mean.ravel(),
+            'std': std.ravel(),
+            'min': self.min.min(axis=2).ravel(),
+            'max': self.max.max(axis=2).ravel(),
+            'sem': (std / np.sqrt(n)).ravel(),
+        })
+        table['cv'] = table['std'] / table['mean'] * 100
+        table['efficacy'] = efficacy.ravel()
+        return table[table['count'] > 0].reset_index(drop=True)
+
+    def anova(self):
+        """Type II two-way ANOVA table from the pooled cell statistics."""
+        sum_sq, df = cell_sums_of_squares(*self.cells())
+        return anova_from_sums_of_squares(sum_sq, df, term_names('Treatment', 'Position'))[0]
+
+    def tukey(self, between='Treatment', strata=None):
+        """Tukey HSD from the accumulators: between a factor, optionally within the other one."""
+        n, mean, m2 = self.cells()
+        if between == 'Position':
+            n, mean, m2 = n.T, mean.T, m2.T
+        other = 'Position' if between == 'Treatment' else 'Treatment'
+        if strata is None:
+            # Pool the other factor: one stratum holding every level of `between`
+            total = n.sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                pooled = (n * np.nan_to_num(mean)).sum(axis=1) / total
+            dev = np.where(n > 0, np.nan_to_num(mean) - np.nan_to_num(pooled)[:, None], 0)
+            m2 = (m2.sum(axis=1) + (n * dev ** 2).sum(axis=1))[None]
+            n, mean = total[None], pooled[None]
+        elif strata == other:
+            n, mean, m2 = n.T, mean.T, m2.T
+        else:
+            raise ValueError(f'strata must be None or {other!r}')
+        result = tukey_from_moments(n, mean, m2, np.asarray(self.levels[between], dtype=object))
+        stratum = result.pop('stratum').to_numpy()
+        if strata is not None:
+            result[strata] = np.asarray(self.levels[strata], dtype=object)[stratum]
+        return result
+
+    # Persistence
+
+    def save(self, path=STATE_FILE):
+        """Write the state atomically to an .npz file."""
+        meta = {'dv': self.dv, 'control': self.control,
+                'levels': {factor: [str(level) if factor != 'Replicate' else int(level) for level in levels]
+                           for factor, levels in self.levels.items()}}
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, n=self.n, mean=self.mean, m2=self.m2, min=self.min, max=self.max,
+                 plates=self.plates, meta=np.array(json.dumps(meta)))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path=STATE_FILE):
+        with np.load(path) as state:
+            if 'plates' not in state:
+                raise ValueError(f'{path} was written by an older version; rebuild the state with --reset')
+            meta = json.loads(str(state['meta']))
+            stats = cls(meta['dv'], meta['control'])
+            stats.levels = meta['levels']
+            for name in ('n', 'mean', 'm2', 'min', 'max', 'plates'):
+                setattr(stats, name, state[name])
+        return stats
+
+    @classmethod
+    def resume(cls, path=STATE_FILE, **options):
+        """The saved state at path, or a fresh one if there is none yet."""
+        return cls.load(path) if os.path.exists(path) else cls(**options)
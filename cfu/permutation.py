@@ -0,0 +1,166 @@
+"""Permutation tests for the terms of the two-way Treatment x Position ANOVA.
+
+Replicates are the experimental units, so whole replicates are permuted,
+never single plates, and the F statistics are computed on replicate means
+(the plates of a replicate are subsamples, not independent units):
+
+- Treatment: replicates are shuffled between treatments within each position
+- Position: replicates are shuffled between positions within each treatment
+- Interaction: Freedman-Lane; residuals of the additive model are shuffled
+  between replicates and added back to its fitted values
+
+Replicate means come from an ExperimentCube. A batch of permutations
+becomes the columns of one response block, so its sums of squares come
+from a single balanced_sums_of_squares call. Batches
+are spread over a process pool, and each term stops once its p-value is
+resolved to the requested precision (or the permutation budget runs out).
+Batches are evaluated in seed order, so the result for a given seed does
+not depend on the number of workers.
+
+Small designs are permuted in this process, since starting workers takes
+longer than the test. Larger ones use the caller's pool or one started with
+the spawn method, never a fork of the (threaded) pipeline process.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from cfu.anova import balanced_sums_of_squares, term_names
+
+MAX_PERMUTATIONS = 10000
+BATCH_SIZE = 1000
+PRECISION = 0.005  # half-width of the ~95% interval around the permutation p-value
+TERMS = ['a', 'b', 'ab']
+PARALLEL_ELEMENTS = 100_000_000  # permuted values below which worker processes cost more than they save
+
+
+def skip_reason(cube):
+    """Why the test cannot run on a cube (replicates without counted plates), or None if it can."""
+    missing = np.argwhere(np.isnan(cube.replicate_means))
+    if not len(missing):
+        return None
+    treatments, positions, replicates = (cube.levels[axis] for axis in cube.axes[:3])
+    cells = [f'{treatments[t]} at {positions[p]}, replicate {replicates[r]}' for t, p, r in missing]
+    return f"no counted plates for {'; '.join(cells)}"
+
+
+def unit_means(cube):
+    """Mean response of every replicate plus each replicate's factor codes.
+
+    Returns (means, unit_a, unit_b, n_a, n_b) with the replicates in cube
+    order. Every Treatment x Position cell needs the same replicates.
+    """
+    reason = skip_reason(cube)
+    if reason is not None:
+        raise ValueError(f'permutation ANOVA needs the same replicates in every cell: {reason}')
+    means = cube.replicate_means
+    n_a, n_b, n_units = means.shape
+    unit_a = np.repeat(np.arange(n_a), n_b * n_units)
+    unit_b = np.tile(np.repeat(np.arange(n_b), n_units), n_a)
+    return means.ravel(), unit_a, unit_b, n_a, n_b
+
+
+def additive_fit(means, unit_a, unit_b, n_a, n_b):
+    """Fitted values of the main-effects-only model for a balanced layout, per unit."""
+    grand = means.mean()
+    a_means = np.bincount(unit_a, weights=means, minlength=n_a) / np.bincount(unit_a, minlength=n_a)
+    b_means = np.bincount(unit_b, weights=means, minlength=n_b) / np.bincount(unit_b, minlength=n_b)
+    return a_means[unit_a] + b_means[unit_b] - grand
+
+
+def f_statistics(Y, unit_a, unit_b, n_a, n_b):
+    """F for A, B and A:B for every column of Y (one row per unit)."""
+    ss, df = balanced_sums_of_squares(Y, unit_a, unit_b, n_a, n_b)
+    return (ss[:3] / df[:3, None]) / (ss[3] / df[3])
+
+
+def block_permutations(rng, blocks, n):
+    """n permutations of the units that only move units within their block, as (n, n_units)."""
+    keys = blocks[None, :] + rng.random((n, len(blocks)))
+    shuffled = np.argsort(keys, axis=1)
+    idx = np.empty_like(shuffled)
+    idx[:, np.argsort(blocks, kind='stable')] = shuffled
+    return idx
+
+
+def _permutation_batch(seed, n, term, means, unit_a, unit_b, n_a, n_b):
+    """Permuted F statistics of one term for a batch of n permutations."""
+    rng = np.random.default_rng(seed)
+    if term == 'ab':
+        fitted = additive_fit(means, unit_a, unit_b, n_a, n_b)
+        idx = block_permutations(rng, np.zeros(len(means)), n)
+        permuted = fitted[None] + (means - fitted)[idx]
+    else:
+        # Shuffle within the levels of the other factor
+        idx = block_permutations(rng, unit_b if term == 'a' else unit_a, n)
+        permuted = means[idx]
+    return f_statistics(permuted.T, unit_a, unit_b, n_a, n_b)[TERMS.index(term)]
+
+
+def permutation_anova(cube, max_permutations=MAX_PERMUTATIONS, batch_size=BATCH_SIZE, precision=PRECISION,
+                      seed=0, workers=None, pool=None):
+    """Permutation p-values for both factors of an ExperimentCube and their interaction.
+
+    The test runs on the replicate means of the cube's first two axes.
+
+    Returns an anova_lm-like table (sum_sq, df, F, PR(>F)) with the
+    permutation p-value in 'p-perm' and the permutations used in 'n_perm'.
+    """
+    means, unit_a, unit_b, n_a, n_b = unit_means(cube)
+    ss, df = balanced_sums_of_squares(means[:, None], unit_a, unit_b, n_a, n_b)
+    observed = ((ss[:3] / df[:3, None]) / (ss[3] / df[3]))[:, 0]
+
+    n_batches = -(-max_permutations // batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(TERMS) * n_batches)
+    sizes = [min(batch_size, max_permutations - i * batch_size) for i in range(n_batches)]
+    args = (means, unit_a, unit_b, n_a, n_b)
+    workers = workers or os.cpu_count() or 1
+    if len(means) * max_permutations * len(TERMS) < PARALLEL_ELEMENTS:
+        workers = 1
+
+    exceed = np.zeros(len(TERMS), dtype=int)
+    used = np.zeros(len(TERMS), dtype=int)
+    own_pool = None
+    if workers == 1:
+        pool = None
+    elif pool is None:
+        pool = own_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for t, term in enumerate(TERMS):
+            batch = 0
+            while batch < n_batches:
+                # One round: as many batches as there are workers, checked in order
+                round_ = range(batch, min(batch + workers, n_batches))
+                if pool is None:
+                    results = [_permutation_batch(seeds[t * n_batches + i], sizes[i], term, *args)
+                               for i in round_]
+                else:
+                    futures = [pool.submit(_permutation_batch, seeds[t * n_batches + i], sizes[i], term, *args)
+                               for i in round_]
+                    results = [future.result() for future in futures]
+                for F in results:
+                    exceed[t] += np.count_nonzero(F >= observed[t] * (1 - 1e-12))
+                    used[t] += len(F)
+                    batch += 1
+                    p = (exceed[t] + 1) / (used[t] + 1)
+                    if 1.96 * np.sqrt(p * (1 - p) / used[t]) < precision:
+                        batch = n_batches
+                        break
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+
+    table = pd.DataFrame({
+        'sum_sq': ss[:, 0],
+        'df': df,
+        'F': np.append(observed, np.nan),
+    }, index=term_names(*cube.axes[:2]))
+    table['PR(>F)'] = np.append(stats.f.sf(observed, df[:3], df[3]), np.nan)
+    table['p-perm'] = np.append((exceed + 1) / (used + 1), np.nan)
+    table['n_perm'] = np.append(used, 0)
+    return table
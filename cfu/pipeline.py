@@ -0,0 +1,348 @@
+"""Stages of the analysis and their wiring through the artifact cache.
+
+Every output of the basic and the enhanced analysis is a node in one
+dependency graph: loading, the tidy frame, the experiment cube, each
+statistics stage, every figure, the results store (cfu.results), each
+report section and the report. TARGETS names the nodes
+behind each set of outputs, and build_targets brings any combination of
+them up to date in one pass, computing each node at most once. Figures
+render concurrently in a process pool; every other node, the statistics
+included, runs in turn in the calling process (see run_stages).
+
+Stage functions import their heavy libraries locally, so building the stage
+graph (and serving a fully cached run) does not load pandas, scipy or
+matplotlib.
+"""
+
+import os
+from functools import partial
+
+from cfu.cache import ArtifactCache
+
+ALPHA = 0.05
+DPI = 300
+N_RESAMPLES = 10000
+MAX_PERMUTATIONS = 10000
+PERM_PRECISION = 0.005
+SEED = 0
+REPORT_FILE = 'cfu_analysis_report.md'
+HTML_REPORT_FILE = 'cfu_analysis_report.html'
+RESULTS_DIR = 'cfu_results'
+
+# Figure file -> the stage it is drawn from (file names must match the report)
+FIGURE_FILES = {
+    'enhanced_cfu_boxplot.png': 'tidy',
+    'grouped_cfu_barplot.png': 'cube',
+    'cfu_heatmap.png': 'cube',
+    'cfu_violin_plot.png': 'tidy',
+    'treatment_efficacy.png': 'efficacy',
+    'enhanced_interaction_plot.png': 'cube',
+}
+# The plots of the basic analysis (cfu_analysis.py), drawn at matplotlib's default resolution
+BASIC_FIGURE_FILES = {
+    'cfu_boxplot.png': 'tidy',
+    'interaction_plot.png': 'cube',
+    'cfu_barplot.png': 'cube',
+}
+BASIC_DPI = 100
+STATISTICS = ('summary', 'assumptions', 'anova', 'posthoc', 'efficacy', 'permutation', 'nonparametric',
+              'count_model')
+
+# Target -> the stages it needs up to date
+TARGETS = {
+    'stats': list(STATISTICS),
+    'basic': ['anova', 'posthoc'] + [f'figure:{name}' for name in BASIC_FIGURE_FILES],
+    'figures': [f'figure:{name}' for name in FIGURE_FILES],
+    'results': ['results'],
+    'report': ['report', 'results'] + [f'figure:{name}' for name in FIGURE_FILES],
+}
+
+
+def load_data(path, position_map=None, treatment_map=None):
+    from cfu.loader import POSITION_MAP, TREATMENT_MAP, group_codes, load_plate_counts
+
+    # Read the CSV file into a tidy frame (one row per plate) with readable
+    # Position and Treatment labels (the thesis codes unless other maps are given)
+    tidy_df = load_plate_counts(path, position_map=position_map or POSITION_MAP,
+                                treatment_map=treatment_map or TREATMENT_MAP)
+
+    # Create merged treatment-position column for some visualizations (a
+    # categorical combined from the integer codes, no per-row string concatenation)
+    tidy_df['Treatment_Position'] = group_codes(tidy_df, ['Treatment', 'Position'])
+    return tidy_df
+
+
+def build_cube(tidy_df):
+    from cfu.cube import ExperimentCube
+
+    # Dense Treatment x Position x Replicate x Plate array shared by the summary, tests and figures
+    return ExperimentCube.from_tidy(tidy_df, dv='CFU')
+
+
+def summarize(cube):
+    import numpy as np
+
+    # Calculate summary statistics from the cached cell statistics of the cube
+    summary_stats = cube.frame(['count', 'mean', 'std', 'min', 'max', 'sem'])
+    summary_stats['cv'] = cube.cv.ravel()  # coefficient of variation
+
+    # Calculate relative efficacy compared to control (the control row of the cube against every row)
+    control = list(cube.levels['Treatment']).index('Control')
+    efficacy = (cube.mean[control] - cube.mean) / cube.mean[control] * 100
+    efficacy[control] = np.nan
+    summary_stats['efficacy'] = efficacy.ravel()
+    return summary_stats
+
+
+def check_assumptions(tidy_df, alpha=ALPHA):
+    from cfu import assumptions
+
+    # Shapiro-Wilk per group, Levene / Brown-Forsythe and residual diagnostics in one pass
+    return assumptions.check_assumptions(tidy_df, dv='CFU', factors=['Treatment', 'Position'], alpha=alpha)
+
+
+def run_anova(tidy_df):
+    from cfu.anova import two_way_anova
+
+    # Two-way ANOVA
+    return two_way_anova(tidy_df, dv='CFU')
+
+
+def run_posthoc(tidy_df):
+    from cfu.posthoc import pairwise_tukey
+
+    return {
+        'treatment': pairwise_tukey(tidy_df, dv='CFU', between='Treatment'),
+        'position': pairwise_tukey(tidy_df, dv='CFU', between='Position'),
+        # Treatments compared within each position, all positions in one pass
+        'interaction': pairwise_tukey(tidy_df, dv='CFU', between='Treatment', strata='Position'),
+    }
+
+
+def estimate_efficacy(tidy_df, n_resamples=N_RESAMPLES, seed=SEED, workers=None, pool=None):
+    from cfu.bootstrap import efficacy_intervals
+
+    # Efficacy per position and overall, with bootstrap CIs over plates within replicates
+    return efficacy_intervals(tidy_df, dv='CFU', control='Control',
+                              n_resamples=n_resamples, seed=seed, workers=workers, pool=pool)
+
+
+def run_permutation_anova(cube, max_permutations=MAX_PERMUTATIONS, precision=PERM_PRECISION,
+                          seed=SEED, workers=None, pool=None):
+    from cfu.permutation import permutation_anova, skip_reason
+
+    # Whole replicates are shuffled, so every cell needs the same replicates;
+    # without them (e.g. while plates are still being entered) the test is
+    # skipped and the reason recorded for the report
+    reason = skip_reason(cube)
+    if reason is not None:
+        return {'skipped': reason}
+
+    # Distribution-free check of the ANOVA terms, shuffling whole replicates
+    return permutation_anova(cube, max_permutations=max_permutations,
+                             precision=precision, seed=seed, workers=workers, pool=pool)
+
+
+def run_rank_tests(tidy_df, assumptions):
+    from cfu.assumptions import assumptions_met
+    from cfu.nonparametric import aligned_rank_anova, kruskal_dunn
+
+    # The rank-based path is only taken when the normality or equal-variance checks fail
+    if assumptions_met(assumptions):
+        return None
+    kruskal, dunn = kruskal_dunn(tidy_df, dv='CFU', between='Treatment', strata='Position')
+    return {'art': aligned_rank_anova(tidy_df, dv='CFU'), 'kruskal': kruskal, 'dunn': dunn}
+
+
+def fit_count_models(tidy_df):
+    from cfu.glm import count_model
+
+    # Poisson and negative-binomial GLMs, with efficacy as rate ratios against the control
+    return count_model(tidy_df, dv='CFU', control='Control')
+
+
+def draw_figure(name, path, dpi, table):
+    from cfu.plots import FIGURES
+
+    # Module-level (and used through functools.partial) so it can be sent to a process pool
+    return FIGURES[name][0](table, path, dpi)
+
+
+def store_results(root, *values):
+    from cfu.results import write_results
+
+    # Every statistics table written once to the columnar store, in the order of STATISTICS
+    return write_results(root, dict(zip(STATISTICS, values)))
+
+
+def render_section(name, inputs, *values):
+    from cfu.report import section_texts
+
+    return section_texts(name, dict(zip(inputs, values)))
+
+
+def _write_report(path, html_path, *sections):
+    from cfu.report import write_report
+
+    return write_report(sections, path, html_path)
+
+
+def build_stages(csv_path, outdir='.', cache=None, alpha=ALPHA, dpi=DPI,
+                 n_resamples=N_RESAMPLES, seed=SEED, workers=None,
+                 max_permutations=MAX_PERMUTATIONS, perm_precision=PERM_PRECISION, pool=None,
+                 position_map=None, treatment_map=None):
+    """Declare every stage for one experiment; returns a dict of cache artifacts.
+
+    Nothing is computed here; stages run when their value is first needed.
+    Large bootstrap and permutation runs use pool (a process pool that is
+    already started) when one is given. position_map and treatment_map
+    replace the loader's thesis codes (see cfu.synthetic.label_maps); the
+    figures draw whatever levels the data then has.
+    """
+    # Only the section list and template paths (cfu.report itself imports nothing heavy)
+    from cfu.report import PAGE_TEMPLATE, SECTIONS, TEMPLATE_DIR, template_files
+
+    cache = cache if cache is not None else ArtifactCache()
+    stages = {}
+    stages['data'] = data = cache.input(csv_path)
+    # Stages below the tidy frame are keyed on its contents, so edits that leave
+    # the plate counts unchanged do not rerun them
+    stages['tidy'] = tidy = cache.stage(
+        'tidy', partial(load_data, position_map=position_map, treatment_map=treatment_map), [data],
+        params={'position_map': position_map, 'treatment_map': treatment_map},
+        code=[load_data, 'cfu.loader'], cutoff=True)
+    stages['cube'] = cube = cache.stage('cube', build_cube, [tidy], code=[build_cube, 'cfu.cube'])
+    stages['summary'] = summary = cache.stage('summary', summarize, [cube], code=[summarize, 'cfu.cube'])
+    stages['assumptions'] = assumptions = cache.stage(
+        'assumptions', lambda df: check_assumptions(df, alpha), [tidy],
+        params={'alpha': alpha}, code=[check_assumptions, 'cfu.assumptions'])
+    stages['anova'] = anova = cache.stage('anova', run_anova, [tidy], code=[run_anova, 'cfu.anova'])
+    stages['posthoc'] = posthoc = cache.stage('posthoc', run_posthoc, [tidy],
+                                              code=[run_posthoc, 'cfu.posthoc'])
+    stages['efficacy'] = efficacy = cache.stage(
+        'efficacy', lambda df: estimate_efficacy(df, n_resamples, seed, workers, pool), [tidy],
+        params={'n_resamples': n_resamples, 'seed': seed},
+        code=[estimate_efficacy, 'cfu.bootstrap'])
+    stages['permutation'] = permutation = cache.stage(
+        'permutation', lambda df: run_permutation_anova(df, max_permutations, perm_precision, seed, workers, pool),
+        [cube], params={'max_permutations': max_permutations, 'precision': perm_precision, 'seed': seed},
+        code=[run_permutation_anova, 'cfu.permutation', 'cfu.anova', 'cfu.cube'])
+    stages['nonparametric'] = nonparametric = cache.stage(
+        'nonparametric', run_rank_tests, [tidy, assumptions],
+        code=[run_rank_tests, 'cfu.nonparametric', 'cfu.anova', 'cfu.assumptions'])
+    stages['count_model'] = count_model = cache.stage('count_model', fit_count_models, [tidy],
+                                                      code=[fit_count_models, 'cfu.glm', 'cfu.anova'])
+
+    # Figures depend on the plotting code but not on the statistics code, so
+    # restyling a plot only re-renders figures
+    figures = [(name, source, dpi) for name, source in FIGURE_FILES.items()]
+    figures += [(name, source, BASIC_DPI) for name, source in BASIC_FIGURE_FILES.items()]
+    for name, source, figure_dpi in figures:
+        path = os.path.join(outdir, name)
+        stages[f'figure:{name}'] = cache.stage(f'figure:{path}', partial(draw_figure, name, path, figure_dpi),
+                                               [stages[source]], params={'dpi': figure_dpi},
+                                               code=['cfu.plots'], outputs=[path], kind='figure')
+
+    results_dir = os.path.join(outdir, RESULTS_DIR)
+    stages['results'] = cache.stage(
+        f'results:{results_dir}', partial(store_results, results_dir), [stages[name] for name in STATISTICS],
+        code=[store_results, 'cfu.results'], outputs=[os.path.join(results_dir, 'index.json')])
+
+    # Each report section depends only on the statistics it shows and on its templates; sections are
+    # cut off on their text, so the report is only rewritten when some section reads differently
+    sections = []
+    for name, (inputs, _) in SECTIONS.items():
+        stages[f'section:{name}'] = section = cache.stage(
+            f'section:{name}', partial(render_section, name, inputs), [stages[dep] for dep in inputs],
+            code=['cfu.report', *template_files(name)], cutoff=True)
+        sections.append(section)
+    report_path = os.path.join(outdir, REPORT_FILE)
+    html_path = os.path.join(outdir, HTML_REPORT_FILE)
+    stages['report'] = cache.stage(
+        f'report:{report_path}', partial(_write_report, report_path, html_path), sections,
+        params={'alpha': alpha}, code=['cfu.report', os.path.join(TEMPLATE_DIR, PAGE_TEMPLATE)],
+        outputs=[report_path, html_path])
+    return stages
+
+
+def run_stages(stages, names, workers=None, pool=None):
+    """Bring the named stages up to date; returns the paths of the outputs that were rewritten.
+
+    Each needed stage runs once, as soon as the stages it depends on are
+    done. Stale figures render side by side in a process pool (pool if
+    given, else one started for this call) while the computations carry on
+    in this process; workers=1 runs everything in turn in this process.
+
+    The statistics stages are not run concurrently with each other: their
+    compute functions are closures over this run's cache and parameters, so
+    they cannot be sent to a process pool, and the pandas, scipy and
+    statsmodels code they spend most of their time in holds the GIL, so
+    threads would not overlap them either. The two expensive ones, the
+    bootstrap and the permutation test, spread their own resamples over
+    worker processes instead.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+    # The stages to run and, for those that are not cached, the inputs they wait for
+    graph = {}
+    todo = [stages[name] for name in reversed(names)]
+    while todo:
+        artifact = todo.pop()
+        if artifact not in graph:
+            graph[artifact] = [] if artifact.fresh else artifact.deps
+            todo.extend(reversed(graph[artifact]))
+
+    stale_figures = [art for art in graph if art.kind == 'figure' and not art.fresh]
+    own_pool = None
+    if pool is None and workers != 1 and len(stale_figures) > 1:
+        pool = own_pool = ProcessPoolExecutor(max_workers=workers or min(len(stale_figures), os.cpu_count() or 1))
+    if pool is not None and stale_figures:
+        # Start the workers now, from this thread: forking while other threads run is not safe
+        pool.submit(os.getpid).result()
+
+    paths = []
+    waiting, done = dict(graph), set()
+    try:
+        # Threads only wait for figures rendering in the pool; the stages themselves run here
+        with ThreadPoolExecutor(max_workers=max(len(stale_figures), 1)) as waiters:
+            rendering = {}
+            while waiting or rendering:
+                ready = [art for art, deps in waiting.items() if done.issuperset(deps)]
+                for artifact in ready:
+                    if artifact.kind == 'figure' and pool is not None:
+                        del waiting[artifact]
+                        rendering[waiters.submit(artifact.build, pool)] = artifact
+                local = [art for art in ready if art in waiting]
+                if local:
+                    artifact = local[0]
+                    del waiting[artifact]
+                    if artifact.outputs:
+                        artifact.build()
+                    else:
+                        artifact.value
+                    finished = [artifact]
+                else:
+                    futures, _ = wait(rendering, return_when=FIRST_COMPLETED)
+                    finished = [rendering.pop(future) for future in futures]
+                    for future in futures:
+                        future.result()
+                for artifact in finished:
+                    done.add(artifact)
+                    if artifact.outputs and artifact.recomputed:
+                        paths += artifact.outputs
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+    return paths
+
+
+def build_targets(stages, targets=('report',), workers=None, pool=None):
+    """Bring the outputs of the named TARGETS up to date in one pass; returns the rewritten paths."""
+    names = list(dict.fromkeys(name for target in targets for name in TARGETS[target]))
+    return run_stages(stages, names, workers, pool)
+
+
+def statistics(stages, workers=None):
+    """Values of the statistics stages, keyed by stage name."""
+    build_targets(stages, ['stats'], workers)
+    return {name: stages[name].value for name in STATISTICS}
@@ -0,0 +1,382 @@
+"""Figure builders for the report plots.
+
+Each builder draws one figure with the object-oriented API on the Agg
+backend and writes it to disk. They take only the table they need (the
+tidy frame for the distribution plots, the bootstrap intervals for the
+efficacy chart and the ExperimentCube's cached cell statistics for
+everything else), so the pipeline can farm them out to a process pool.
+FIGURES maps every output file, the report's figures and the three plots
+of the basic analysis, to its builder. Positions and treatments are drawn
+in the order of the data's levels (the loader's label maps), so designs
+with more levels than the thesis get every level; treatments outside
+COLORS get the remaining Set1 colours.
+
+Above LARGE_N plates the box and violin plots switch to a large-data mode
+whose drawing cost does not grow with the number of plates: boxes and the
+violins' inner boxes come from per-group quantiles, violins are smoothed
+histograms on a shared grid instead of a KDE evaluated over every point,
+and the raw-point overlay is a seeded subsample drawn as a raster layer.
+Smaller data sets are drawn exactly as before.
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.style
+import matplotlib.ticker as mtick
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+
+STYLE = 'ggplot'
+COLORS = {'Control': '#e41a1c', 'Botector': '#377eb8', 'Potassium Bicarbonate': '#4daf4a'}
+DPI = 300
+BASIC_DPI = 100  # matplotlib's default, which the basic analysis has always used
+LARGE_N = 10000  # plates above which box and violin plots use the large-data mode
+STRIP_POINTS = 300  # raw points drawn per Position x Treatment group in large-data mode
+GRID_POINTS = 200  # histogram bins of the large-data violins
+DODGE_WIDTH = 0.8  # width shared by the treatments at one position, as in seaborn
+
+
+def _save(fig, path, dpi):
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def _levels(column):
+    return list(column.cat.categories) if isinstance(column.dtype, pd.CategoricalDtype) else sorted(column.unique())
+
+
+def palette(treatments):
+    """Colour of every treatment: COLORS (the start of ColorBrewer's Set1) where it has one, the rest of Set1 next."""
+    others = [t for t in treatments if t not in COLORS]
+    spare = [color for color in sns.color_palette('Set1').as_hex() if color not in COLORS.values()]
+    if len(others) > len(spare):
+        spare = sns.color_palette('husl', len(others)).as_hex()
+    return {t: COLORS.get(t) or dict(zip(others, spare))[t] for t in treatments}
+
+
+def _offsets(n, width=0.75):
+    """(bar width, offset of each of n bars from the group centre) for bars side by side."""
+    bar_width = width / n
+    return bar_width, [(i - (n - 1) / 2) * bar_width for i in range(n)]
+
+
+def distribution_summary(tidy, points=STRIP_POINTS, grid_points=GRID_POINTS, seed=0):
+    """Per Position x Treatment box statistics, smoothed density and point subsample.
+
+    Returns (positions, treatments, groups, grid) where groups maps
+    (position, treatment) to a dict with the quartiles and whiskers, the
+    density on grid (Scott's bandwidth, zero beyond two bandwidths of the
+    data like seaborn's violins) and at most `points` values drawn at random.
+    The work is one sort plus a histogram per group.
+    """
+    tidy = tidy.dropna(subset=['CFU'])
+    positions, treatments = _levels(tidy['Position']), _levels(tidy['Treatment'])
+    codes = (pd.Index(positions).get_indexer(tidy['Position']) * len(treatments)
+             + pd.Index(treatments).get_indexer(tidy['Treatment']))
+    y = tidy['CFU'].to_numpy(dtype=float)
+    order = np.lexsort((y, codes))
+    codes, y = codes[order], y[order]
+    bounds = np.searchsorted(codes, np.arange(len(positions) * len(treatments) + 1))
+    rng = np.random.default_rng(seed)
+
+    groups = {}
+    for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+        values = y[start:stop]
+        if not len(values):
+            continue
+        q1, med, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        sd = values.std(ddof=1) if len(values) > 1 else 0.0
+        groups[positions[i // len(treatments)], treatments[i % len(treatments)]] = {
+            'values': values, 'q1': q1, 'med': med, 'q3': q3,
+            'whislo': values[np.searchsorted(values, q1 - 1.5 * iqr)],
+            'whishi': values[np.searchsorted(values, q3 + 1.5 * iqr, side='right') - 1],
+            'bw': sd * len(values) ** -0.2,
+            'sample': values[rng.choice(len(values), min(points, len(values)), replace=False)],
+        }
+
+    # Shared grid wide enough for every violin's tails
+    cut = 2 * max(group['bw'] for group in groups.values())
+    grid = np.linspace(y.min() - cut, y.max() + cut, grid_points + 1)
+    step = grid[1] - grid[0]
+    for group in groups.values():
+        values = group.pop('values')
+        hist = np.histogram(values, bins=grid)[0].astype(float)
+        sigma = max(group['bw'] / step, 1.0)  # in bins; at least one so integer counts do not comb
+        offsets = np.arange(-min(int(4 * sigma), grid_points), min(int(4 * sigma), grid_points) + 1)
+        density = np.convolve(hist, np.exp(-0.5 * (offsets / sigma) ** 2), mode='same')
+        centers = (grid[:-1] + grid[1:]) / 2
+        support = (centers >= values[0] - 2 * group['bw']) & (centers <= values[-1] + 2 * group['bw'])
+        group['density'] = np.where(support, density / (density.sum() * step), 0.0)
+    return positions, treatments, groups, (grid[:-1] + grid[1:]) / 2
+
+
+def _dodged(p, t, n_treatments):
+    """x of treatment t at position p, with the treatments side by side as in seaborn."""
+    slot = DODGE_WIDTH / n_treatments
+    return p - DODGE_WIDTH / 2 + slot * (t + 0.5), slot
+
+
+def _treatment_legend(ax, treatments):
+    colors = palette(treatments)
+    ax.legend([Patch(facecolor=sns.desaturate(colors[t], 0.75), edgecolor='0.2') for t in treatments],
+              treatments, title='Treatment')
+
+
+def _large_boxplot(ax, tidy):
+    """Box plot from group quantiles with a rasterized subsample of the raw points."""
+    positions, treatments, groups, _ = distribution_summary(tidy)
+    colors = palette(treatments)
+    for t, treatment in enumerate(treatments):
+        stats, xs, sample_x, sample_y = [], [], [], []
+        for p, position in enumerate(positions):
+            group = groups.get((position, treatment))
+            if group is None:
+                continue
+            x, slot = _dodged(p, t, len(treatments))
+            stats.append(dict(group, fliers=[]))
+            xs.append(x)
+            sample_x.append(x + np.random.default_rng([p, t]).uniform(-0.4, 0.4, len(group['sample'])) * slot * 0.8)
+            sample_y.append(group['sample'])
+        color = colors[treatment]
+        ax.bxp(stats, positions=xs, widths=DODGE_WIDTH / len(treatments) * 0.9, patch_artist=True,
+               boxprops={'facecolor': sns.desaturate(color, 0.75), 'edgecolor': '0.2'},
+               medianprops={'color': '0.2'}, whiskerprops={'color': '0.2'}, capprops={'color': '0.2'},
+               manage_ticks=False)
+        if sample_x:
+            ax.scatter(np.concatenate(sample_x), np.concatenate(sample_y), s=16, alpha=0.4,
+                       color=color, edgecolor='none', rasterized=True, zorder=3)
+    ax.set_xticks(range(len(positions)), positions)
+    ax.set_xlim(-0.5, len(positions) - 0.5)
+    _treatment_legend(ax, treatments)
+
+
+def _large_violinplot(ax, tidy):
+    """Violins from smoothed group histograms, each with a box of its quartiles and whiskers."""
+    positions, treatments, groups, grid = distribution_summary(tidy)
+    colors = palette(treatments)
+    # Violins of one treatment share a scale and the widest fills its dodge slot
+    # (seaborn's density_norm='area' without common_norm)
+    peak = {treatment: max(group['density'].max() for (_, t), group in groups.items() if t == treatment)
+            for treatment in {t for _, t in groups}}
+    for (position, treatment), group in groups.items():
+        x, slot = _dodged(positions.index(position), treatments.index(treatment), len(treatments))
+        half = group['density'] / peak[treatment] * slot / 2
+        inside = half > 0
+        ax.fill_betweenx(grid[inside], x - half[inside], x + half[inside],
+                         facecolor=sns.desaturate(colors[treatment], 0.75), edgecolor='0.2', linewidth=1)
+        ax.vlines(x, group['whislo'], group['whishi'], color='0.2', linewidth=1)
+        ax.vlines(x, group['q1'], group['q3'], color='0.2', linewidth=4)
+        ax.scatter([x], [group['med']], s=12, color='white', zorder=3)
+    ax.set_xticks(range(len(positions)), positions)
+    ax.set_xlim(-0.5, len(positions) - 0.5)
+    _treatment_legend(ax, treatments)
+
+
+def boxplot_figure(tidy, path, dpi=DPI):
+    """Box plot of CFU by position and treatment with the raw points overlaid."""
+    with matplotlib.style.context(STYLE):
+        fig = Figure(figsize=(14, 8))
+        ax = fig.subplots()
+        if len(tidy) > LARGE_N:
+            _large_boxplot(ax, tidy)
+        else:
+            colors = palette(_levels(tidy['Treatment']))
+            sns.boxplot(x='Position', y='CFU', hue='Treatment', data=tidy, palette=colors, ax=ax)
+
+            # Add individual data points
+            sns.stripplot(x='Position', y='CFU', hue='Treatment', data=tidy,
+                          size=4, alpha=0.6, dodge=True, palette=colors, jitter=True, ax=ax)
+
+            # Box and strip layers both add legend entries; keep one set
+            handles, labels = ax.get_legend_handles_labels()
+            ax.legend(handles[:len(colors)], labels[:len(colors)], title='Treatment')
+
+        ax.set_title('CFU Counts by Position and Treatment', fontsize=16, fontweight='bold')
+        ax.set_ylabel('Colony Forming Units (CFU)', fontsize=14)
+        ax.set_xlabel('Position on Slope', fontsize=14)
+        ax.grid(True, linestyle='--', alpha=0.7)
+        return _save(fig, path, dpi)
+
+
+def grouped_barplot_figure(cube, path, dpi=DPI):
+    """Mean CFU per position as grouped bars (one per treatment) with SEM error bars."""
+    means = cube.table('mean').fillna(0)
+    errors = cube.table('sem').fillna(0)
+    colors = palette(list(means.columns))
+
+    with matplotlib.style.context(STYLE):
+        fig = Figure(figsize=(14, 8))
+        ax = fig.subplots()
+
+        # Define the x locations for the groups
+        positions = range(len(means.index))
+        bar_width, offsets = _offsets(len(means.columns))
+        opacity = 0.8
+
+        # Plot each treatment as grouped bars
+        for treatment, offset in zip(means.columns, offsets):
+            ax.bar([x + offset for x in positions], means[treatment], bar_width,
+                   alpha=opacity, color=colors[treatment], label=treatment,
+                   yerr=errors[treatment], capsize=5)
+
+        ax.set_xlabel('Position on Slope', fontsize=14)
+        ax.set_ylabel('Mean CFU Count', fontsize=14)
+        ax.set_title('Mean CFU Counts by Position and Treatment', fontsize=16, fontweight='bold')
+        ax.set_xticks(list(positions))
+        ax.set_xticklabels(means.index)
+        ax.legend(title='Treatment')
+        ax.grid(True, linestyle='--', alpha=0.7)
+        return _save(fig, path, dpi)
+
+
+def heatmap_figure(cube, path, dpi=DPI):
+    """Heat map of mean CFU, positions as rows and treatments as columns."""
+    heatmap_data = cube.table('mean')
+
+    with matplotlib.style.context(STYLE):
+        fig = Figure(figsize=(12, 8))
+        ax = fig.subplots()
+        sns.heatmap(heatmap_data, annot=True, fmt=".4f", cmap="YlOrRd", linewidths=.5, ax=ax)
+        ax.set_title('Mean CFU Counts Heatmap', fontsize=16, fontweight='bold')
+        return _save(fig, path, dpi)
+
+
+def violin_figure(tidy, path, dpi=DPI):
+    """Violin plot of CFU by position and treatment with an embedded box plot."""
+    with matplotlib.style.context(STYLE):
+        fig = Figure(figsize=(14, 8))
+        ax = fig.subplots()
+        if len(tidy) > LARGE_N:
+            _large_violinplot(ax, tidy)
+        else:
+            sns.violinplot(x='Position', y='CFU', hue='Treatment', data=tidy,
+                           palette=palette(_levels(tidy['Treatment'])), split=False, inner='box',
+                           linewidth=1, ax=ax)
+        ax.set_title('Distribution of CFU Counts by Position and Treatment', fontsize=16, fontweight='bold')
+        ax.set_ylabel('Colony Forming Units (CFU)', fontsize=14)
+        ax.set_xlabel('Position on Slope', fontsize=14)
+        ax.grid(True, linestyle='--', alpha=0.7)
+        return _save(fig, path, dpi)
+
+
+def efficacy_figure(efficacy, path, dpi=DPI):
+    """Percent reduction in CFU relative to the control at each position, with bootstrap CIs."""
+    efficacy_data = efficacy['by_position']
+    order = list(efficacy_data['Position'].unique())
+    hue_order = list(efficacy_data['Treatment'].unique())
+
+    with matplotlib.style.context(STYLE):
+        fig = Figure(figsize=(12, 7))
+        ax = fig.subplots()
+        sns.barplot(x='Position', y='efficacy', hue='Treatment', data=efficacy_data,
+                    order=order, hue_order=hue_order,
+                    palette=palette(hue_order), ax=ax)
+
+        # Bootstrap interval on each bar (containers follow hue_order, bars follow order)
+        bar_containers = list(ax.containers)
+        intervals = efficacy_data.set_index(['Treatment', 'Position'])
+        for container, treatment in zip(bar_containers, hue_order):
+            for bar, position in zip(container, order):
+                low, high = intervals.loc[(treatment, position), ['ci_low', 'ci_high']]
+                ax.errorbar(bar.get_x() + bar.get_width() / 2, bar.get_height(),
+                            yerr=[[bar.get_height() - low], [high - bar.get_height()]],
+                            color='black', capsize=5, linewidth=1)
+
+        # Add percentage signs to y-axis and value labels inside the bars (clear of the CIs)
+        ax.yaxis.set_major_formatter(mtick.PercentFormatter())
+        for container in bar_containers:
+            ax.bar_label(container, fmt='%.4f%%', label_type='center')
+
+        ax.set_title('Treatment Efficacy Compared to Control', fontsize=16, fontweight='bold')
+        ax.set_ylabel(f"Reduction in CFU (%, {efficacy['ci']:g}% CI)", fontsize=14)
+        ax.set_xlabel('Position on Slope', fontsize=14)
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
+        return _save(fig, path, dpi)
+
+
+def interaction_figure(cube, path, dpi=DPI):
+    """Mean CFU across positions, one line per treatment."""
+    interaction_pivot = cube.table('mean')
+
+    with matplotlib.style.context(STYLE):
+        fig = Figure(figsize=(12, 7))
+        ax = fig.subplots()
+        for treatment, color in palette(list(interaction_pivot.columns)).items():
+            ax.plot(interaction_pivot.index, interaction_pivot[treatment], marker='o',
+                    linewidth=2, markersize=8, label=treatment, color=color)
+
+        ax.set_title('Interaction Plot: Treatment × Position', fontsize=16, fontweight='bold')
+        ax.set_ylabel('Mean CFU Count', fontsize=14)
+        ax.set_xlabel('Position on Slope', fontsize=14)
+        ax.grid(True, linestyle='--', alpha=0.7)
+        ax.legend(title='Treatment')
+        return _save(fig, path, dpi)
+
+
+def basic_boxplot_figure(tidy, path, dpi=BASIC_DPI):
+    """The basic analysis's box plot: CFU by position and treatment in seaborn's default colours."""
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    sns.boxplot(x='Position', y='CFU', hue='Treatment', data=tidy, ax=ax)
+    ax.set_title('CFU Counts by Position and Treatment')
+    ax.set_ylabel('Colony Forming Units (CFU)')
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def basic_interaction_figure(cube, path, dpi=BASIC_DPI):
+    """The basic analysis's interaction plot: mean CFU across positions, one line per treatment."""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    cube.table('mean').plot(marker='o', ax=ax)
+    ax.set_title('Interaction Plot: Treatment × Position')
+    ax.set_ylabel('Mean CFU Count')
+    ax.grid(True, linestyle='--', alpha=0.7)
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def basic_barplot_figure(cube, path, dpi=BASIC_DPI):
+    """The basic analysis's bar plot: mean CFU per treatment, one bar per position, SEM error bars."""
+    means = cube.table('mean').T
+    errors = cube.table('sem').T
+
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    bar_width, offsets = _offsets(len(means.columns))
+    positions = np.arange(len(means.index))
+
+    # Plot each position as a group of bars
+    for pos, offset in zip(means.columns, offsets):
+        ax.bar(positions + offset, means[pos], width=bar_width,
+               yerr=errors[pos], capsize=5, label=pos)
+
+    ax.set_xticks(positions)
+    ax.set_xticklabels(means.index)
+    ax.set_ylabel('Mean CFU Count')
+    ax.set_title('Mean CFU Count by Treatment and Position')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+# Output file -> (builder, input table); 'tidy' figures get the raw counts,
+# 'cube' figures the ExperimentCube (cell means and SEMs) and 'efficacy'
+# figures the bootstrap efficacy intervals
+FIGURES = {
+    'enhanced_cfu_boxplot.png': (boxplot_figure, 'tidy'),
+    'grouped_cfu_barplot.png': (grouped_barplot_figure, 'cube'),
+    'cfu_heatmap.png': (heatmap_figure, 'cube'),
+    'cfu_violin_plot.png': (violin_figure, 'tidy'),
+    'treatment_efficacy.png': (efficacy_figure, 'efficacy'),
+    'enhanced_interaction_plot.png': (interaction_figure, 'cube'),
+    'cfu_boxplot.png': (basic_boxplot_figure, 'tidy'),
+    'interaction_plot.png': (basic_interaction_figure, 'cube'),
+    'cfu_barplot.png': (basic_barplot_figure, 'cube'),
+}
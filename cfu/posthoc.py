@@ -0,0 +1,105 @@
+"""Tukey HSD post-hoc comparisons computed for many strata at once.
+
+The output has the same columns as pingouin.pairwise_tukey (A, B, mean(A),
+mean(B), diff, se, T, p-tukey, hedges). With strata, the pooled MSE comes from
+each stratum separately, exactly as if pairwise_tukey had been called on
+every subset, and the stratum columns are appended to the result.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import studentized_range
+
+
+def _stratum_codes(data, strata):
+    """Integer stratum codes (first-appearance order) and a frame of stratum labels."""
+    if not strata:
+        return np.zeros(len(data), dtype=np.intp), pd.DataFrame(index=[0])
+    if len(strata) == 1:
+        codes, levels = pd.factorize(data[strata[0]])
+        return codes, pd.DataFrame({strata[0]: np.asarray(levels)})
+    codes, levels = pd.factorize(pd.MultiIndex.from_frame(data[strata]))
+    return codes, levels.to_frame(index=False)
+
+
+def group_moments(codes, y, n_groups):
+    """Count, mean and sum of squared deviations for every group code."""
+    counts = np.bincount(codes, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.bincount(codes, weights=y, minlength=n_groups) / counts
+    ss = np.bincount(codes, weights=(y - means[codes]) ** 2, minlength=n_groups)
+    return counts, means, ss
+
+
+def pairwise_tukey(data, dv='CFU', between='Treatment', strata=None, effsize='hedges'):
+    """Tukey HSD between the levels of `between`, separately within each stratum.
+
+    strata may be None (one test over the whole frame), a column name or a
+    list of column names. Strata are reported in order of first appearance,
+    levels of `between` in sorted (or category) order, like pingouin.
+    """
+    if effsize not in ('hedges', 'cohen'):
+        raise ValueError(f"effsize must be 'hedges' or 'cohen', not {effsize!r}")
+    strata = [strata] if isinstance(strata, str) else list(strata or [])
+
+    s_codes, s_labels = _stratum_codes(data, strata)
+    g_codes, g_levels = pd.factorize(data[between], sort=True)
+    y = data[dv].to_numpy(dtype=float)
+    keep = (s_codes >= 0) & (g_codes >= 0) & ~np.isnan(y)
+    n_s, n_g = len(s_labels), len(g_levels)
+
+    # One pass over the rows gives every stratum x group cell
+    counts, means, ss = group_moments(s_codes[keep] * n_g + g_codes[keep], y[keep], n_s * n_g)
+    counts, means, ss = (arr.reshape(n_s, n_g) for arr in (counts, means, ss))
+    result = tukey_from_moments(counts, means, ss, np.asarray(g_levels), effsize)
+    stratum = result.pop('stratum').to_numpy()
+    for col in strata:
+        result[col] = s_labels[col].to_numpy()[stratum]
+    return result
+
+
+def tukey_from_moments(counts, means, ss, levels, effsize='hedges'):
+    """Tukey HSD from per-group count, mean and sum of squared deviations.
+
+    The arrays are (n_strata, n_groups); levels names the groups. The result
+    has pairwise_tukey's columns plus 'stratum', the row of each comparison.
+    """
+    present = counts > 0
+
+    # Pooled within-group MSE and its df for each stratum
+    k = present.sum(axis=1)
+    df = counts.sum(axis=1) - k
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mse = ss.sum(axis=1) / df
+
+    # All level pairs in combinations() order, kept where both groups exist
+    i, j = np.triu_indices(counts.shape[1], 1)
+    valid = present[:, i] & present[:, j] & (df > 0)[:, None]
+    s, pair = np.nonzero(valid)
+    a, b = i[pair], j[pair]
+
+    n_a, n_b = counts[s, a], counts[s, b]
+    mean_a, mean_b = means[s, a], means[s, b]
+    diff = mean_a - mean_b
+    se = np.sqrt(mse[s] / n_a + mse[s] / n_b)
+    tval = diff / se
+    pval = np.clip(studentized_range.sf(np.sqrt(2) * np.abs(tval), k[s], df[s]), 0, 1)
+
+    # Effect size from the two groups' own pooled SD, as in pingouin.compute_effsize
+    pooled_sd = np.sqrt((ss[s, a] + ss[s, b]) / (n_a + n_b - 2))
+    ef = diff / pooled_sd
+    if effsize == 'hedges':
+        ef = ef * (1 - 3 / (4 * (n_a + n_b) - 9))
+
+    return pd.DataFrame({
+        'A': levels[a],
+        'B': levels[b],
+        'mean(A)': mean_a,
+        'mean(B)': mean_b,
+        'diff': diff,
+        'se': se,
+        'T': tval,
+        'p-tukey': pval,
+        effsize: ef,
+        'stratum': s,
+    })
@@ -0,0 +1,137 @@
+"""Monte Carlo power of the two-way ANOVA for candidate replicate and plate numbers.
+
+The model behind the simulations is estimated from an existing experiment:
+the Treatment x Position cell means are taken as the true effects, and the
+spread around them is split into a between-replicate and a within-replicate
+(plate) variance by the method of moments for replicates nested in cells.
+Experiments are then simulated from that model for every design in a grid
+of replicates per cell x plates per replicate.
+
+A batch of simulated experiments is one (n_plates_total, n_sims) block,
+analysed by the closed-form balanced sums of squares of cfu.anova, so
+thousands of experiments cost a few array reductions. Batches have a fixed
+size and seeds spawned from one SeedSequence, so the result for a given
+seed does not depend on how many worker processes run them.
+
+Two analyses are scored: the current ANOVA with plates as observations,
+and the same ANOVA on replicate means, the unit the permutation test
+shuffles. When replicates differ beyond plate noise, the plate-level
+ANOVA treats the plates of a replicate as independent, which inflates its
+false-positive rate as well as its power; effect_scale=0 simulates no
+effects and shows that rate directly.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from cfu.anova import balanced_sums_of_squares
+
+N_SIMS = 2000
+ALPHA = 0.05
+REPLICATES = (2, 3, 4, 6, 8)
+PLATES = (3, 5, 10)
+CHUNK_ELEMENTS = 4_000_000  # simulated plate counts held in memory per batch
+ANALYSES = ('plates', 'replicate means')
+
+
+def variance_components(cube):
+    """Cell means and between-replicate / between-plate variances of an ExperimentCube.
+
+    Returns a dict with means (n_treatments, n_positions), replicate_var,
+    plate_var, the factor levels and the typical number of replicates per
+    cell and plates per replicate of the data.
+    """
+    if np.isnan(cube.mean).any():
+        raise ValueError('every Treatment x Position cell needs data to estimate the variance components')
+    plates_per_rep = cube.mask.sum(axis=3)
+    present = plates_per_rep > 0
+    rep_means = cube.replicate_means
+    N, R, C = cube.mask.sum(), present.sum(), cube.count.size
+
+    # Nested one-way ANOVA: plates within replicates, replicates within cells
+    plate_ss = (np.where(cube.mask, cube.values - rep_means[..., None], 0) ** 2).sum()
+    rep_ss = (plates_per_rep * np.where(present, rep_means - cube.mean[:, :, None], 0) ** 2).sum()
+    ms_plate = plate_ss / (N - R)
+    ms_rep = rep_ss / (R - C)
+    n0 = (N - ((plates_per_rep ** 2).sum(axis=2) / cube.count).sum()) / (R - C)
+    return {
+        'means': cube.mean,
+        'replicate_var': max((ms_rep - ms_plate) / n0, 0.0),
+        'plate_var': ms_plate,
+        'levels': {axis: cube.levels[axis] for axis in cube.axes[:2]},
+        'n_replicates': int(np.median(present.sum(axis=2))),
+        'n_plates': int(np.median(plates_per_rep[present])),
+    }
+
+
+def _simulate_chunk(seed, n_sims, means, replicate_sd, plate_sd, n_replicates, n_plates, alpha):
+    """Rejections per analysis and term for one batch of simulated experiments, shape (2, 3)."""
+    rng = np.random.default_rng(seed)
+    n_a, n_b = means.shape
+    shape = (n_a, n_b, n_replicates)
+    replicates = means[:, :, None, None] + replicate_sd * rng.standard_normal(shape + (n_sims,))
+    plates = replicates[:, :, :, None] + plate_sd * rng.standard_normal(shape + (n_plates, n_sims))
+
+    rejections = np.zeros((len(ANALYSES), 3), dtype=np.int64)
+    blocks = [(plates.reshape(-1, n_sims), n_replicates * n_plates),
+              (plates.mean(axis=3).reshape(-1, n_sims), n_replicates)]
+    for k, (Y, per_cell) in enumerate(blocks):
+        a_codes = np.repeat(np.arange(n_a), n_b * per_cell)
+        b_codes = np.tile(np.repeat(np.arange(n_b), per_cell), n_a)
+        sum_sq, df = balanced_sums_of_squares(Y, a_codes, b_codes, n_a, n_b)
+        if df[3] <= 0:
+            rejections[k] = -1
+            continue
+        F = (sum_sq[:3] / df[:3, None]) / (sum_sq[3] / df[3])
+        rejections[k] = (F > stats.f.isf(alpha, df[:3], df[3])[:, None]).sum(axis=1)
+    return rejections
+
+
+def power_grid(components, replicates=REPLICATES, plates=PLATES, n_sims=N_SIMS, alpha=ALPHA,
+               effect_scale=1.0, seed=0, workers=None):
+    """Simulated power of each ANOVA term for every replicates x plates design.
+
+    effect_scale multiplies the deviations of the cell means from their
+    grand mean (0.5 plans for effects half as large as observed, 0 for no
+    effect at all). Returns one row per design and analysis with the share
+    of the n_sims experiments in which each term was significant at alpha;
+    its Monte Carlo standard error is at most 0.5 / sqrt(n_sims). Designs
+    whose analysis has no residual degrees of freedom get NaN.
+    """
+    means = components['means']
+    means = means.mean() + effect_scale * (means - means.mean())
+    replicate_sd = np.sqrt(components['replicate_var'])
+    plate_sd = np.sqrt(components['plate_var'])
+
+    # Fixed batching per design (independent of the worker count) keeps results reproducible
+    designs = [(r, p) for r in replicates for p in plates]
+    jobs = []
+    for design, design_seed in zip(designs, np.random.SeedSequence(seed).spawn(len(designs))):
+        chunk_size = max(1, CHUNK_ELEMENTS // (means.size * design[0] * design[1]))
+        sizes = [min(chunk_size, n_sims - start) for start in range(0, n_sims, chunk_size)]
+        for chunk_seed, size in zip(design_seed.spawn(len(sizes)), sizes):
+            jobs.append((design, (chunk_seed, size, means, replicate_sd, plate_sd, *design, alpha)))
+
+    if workers == 1 or len(jobs) == 1:
+        results = [_simulate_chunk(*args) for _, args in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count() or 1)) as pool:
+            futures = [pool.submit(_simulate_chunk, *args) for _, args in jobs]
+            results = [future.result() for future in futures]
+
+    rejections = {design: 0 for design in designs}
+    for (design, _), result in zip(jobs, results):
+        rejections[design] = rejections[design] + result
+
+    a, b = components['levels']
+    rows = []
+    for (r, p), counts in rejections.items():
+        for k, analysis in enumerate(ANALYSES):
+            power = np.where(counts[k] < 0, np.nan, counts[k] / n_sims)
+            rows.append({'replicates': r, 'plates': p, 'analysis': analysis,
+                         a: power[0], b: power[1], f'{a}:{b}': power[2]})
+    return pd.DataFrame(rows)
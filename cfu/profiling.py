@@ -0,0 +1,170 @@
+"""Wall time, CPU time and peak RSS of pipeline stages and figures.
+
+A Profiler collects one record per span (a computed or cache-loaded stage,
+a rendered figure). Spans can run in worker processes: measure() wraps the
+call there and returns the record with the result, and the parent adds it
+to its trace. Peak RSS is per span where the kernel lets us reset the
+high-water mark (Linux /proc/self/clear_refs); elsewhere it is the peak of
+the process so far, and the record says so. Without the resource module
+(Windows) peak RSS and child CPU time are recorded as None. Selected spans
+can also be run under cProfile, with the stats dumped next to the trace.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+TRACE_FILE = 'cfu_profile.json'
+PROFILE_DIR = 'profiles'  # cProfile dumps, under the output directory
+
+
+def _reset_peak_rss():
+    """Reset the kernel's RSS high-water mark for this process; True if supported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (since the last reset, where supported), or None."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _children_cpu():
+    """CPU seconds used by finished child processes (e.g. a shut-down worker pool), or None."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def profile_path(directory, name):
+    """File for a span's cProfile stats, named after the span."""
+    return os.path.join(directory, re.sub(r'[^\w.-]+', '_', name) + '.prof')
+
+
+def measure(func, args=(), name='', kind='stage', profile_to=None):
+    """Run func(*args) and return (result, record); profile_to dumps cProfile stats there."""
+    prior_peak = peak_rss_mb()
+    # The /proc write is guarded in _reset_peak_rss, so this is safe where /proc does not exist
+    scope = 'span' if _reset_peak_rss() else 'process'
+    profiler = cProfile.Profile() if profile_to else None
+    wall, cpu, child_cpu = time.perf_counter(), time.process_time(), _children_cpu()
+    if profiler:
+        profiler.enable()
+    try:
+        result = func(*args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_to)
+    children_after = _children_cpu()
+    peak = peak_rss_mb()
+    record = {
+        'name': name,
+        'kind': kind,
+        'wall_seconds': time.perf_counter() - wall,
+        'cpu_seconds': time.process_time() - cpu,
+        'child_cpu_seconds': None if child_cpu is None else children_after - child_cpu,
+        'peak_rss_mb': peak,
+        'peak_rss_scope': scope if peak is not None else 'unavailable',
+        'pid': os.getpid(),
+    }
+    # Resetting the high-water mark hides the process's earlier peak; keep it too
+    record['process_peak_rss_mb'] = None if peak is None else max(prior_peak or 0, peak)
+    if profile_to:
+        record['cprofile'] = profile_to
+    return result, record
+
+
+class Profiler:
+    """Collects span records for one run and writes them as a JSON trace.
+
+    cprofile names the spans to run under cProfile: a full span name
+    ('anova', 'figure:out/cfu_heatmap.png') or its kind prefix ('figure').
+    """
+
+    def __init__(self, cprofile=(), profile_dir='.'):
+        self.records = []
+        self.cprofile = set(cprofile)
+        self.profile_dir = profile_dir
+        self.started = time.time()
+
+    def wants_cprofile(self, name):
+        return name in self.cprofile or name.split(':', 1)[0] in self.cprofile
+
+    def profile_to(self, name):
+        """Where to dump cProfile stats for this span, or None if it is not profiled."""
+        if not self.wants_cprofile(name):
+            return None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        return profile_path(self.profile_dir, name)
+
+    def run(self, name, func, args=(), kind='stage'):
+        """Call func(*args) as a measured span; returns its result."""
+        result, record = measure(func, args, name, kind, self.profile_to(name))
+        self.add(record)
+        return result
+
+    def add(self, record):
+        self.records.append(record)
+
+    def trace(self, metrics=None):
+        """The run as a JSON-ready dict; metrics (e.g. import and total time) are included as is."""
+        return {
+            'started': self.started,
+            'wall_seconds': time.time() - self.started,
+            'python': sys.version.split()[0],
+            'metrics': metrics or {},
+            'records': self.records,
+        }
+
+    def write_trace(self, path, metrics=None):
+        with open(path, 'w') as f:
+            json.dump(self.trace(metrics), f, indent=2)
+        return path
+
+    def summary(self):
+        """Plain-text table of the spans, slowest first."""
+        lines = [f"{'span':<44} {'kind':<8} {'wall s':>8} {'cpu s':>8} {'child s':>8} {'peak MB':>8}"]
+        for r in sorted(self.records, key=lambda r: r['wall_seconds'], reverse=True):
+            peak = 'n/a' if r['peak_rss_mb'] is None else (
+                f"{r['peak_rss_mb']:.1f}" + ('' if r['peak_rss_scope'] == 'span' else '*'))
+            child = 'n/a' if r['child_cpu_seconds'] is None else f"{r['child_cpu_seconds']:.3f}"
+            lines.append(f"{r['name'][-44:]:<44} {r['kind']:<8} {r['wall_seconds']:>8.3f} "
+                         f"{r['cpu_seconds']:>8.3f} {child:>8} {peak:>8}")
+        if any(r['peak_rss_scope'] == 'process' for r in self.records):
+            lines.append('* process peak so far (per-span peak RSS is not available on this platform)')
+        if any(r['peak_rss_scope'] == 'unavailable' for r in self.records):
+            lines.append('n/a: peak RSS and child CPU time need the resource module, missing on this platform')
+        return '\n'.join(lines)
+
+
+def top_functions(path, limit=15):
+    """The cumulative-time head of a cProfile dump, as text."""
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,318 @@
+"""Markdown and HTML reports for the enhanced analysis, rendered section by section from templates.
+
+Each section of the report is a template in cfu/templates, filled in with
+str.format from the results the section reads. The section's context
+function picks the template (the permutation and rank-based sections have a
+variant for when they were not run) and turns the results into its fields:
+numbers, the wording that depends on them, and tables. The format spec of a
+table field holds its to_markdown options ('{anova:round=4,index}',
+'{summary:floatfmt=.4f}'), so one template serves both formats: a table is
+a fenced block in the markdown report and a <table> in the HTML one.
+
+SECTIONS lists the sections in report order with the results each one
+reads, so the pipeline caches every section on just those inputs and only
+re-renders the sections whose results changed. A report can also be
+rendered from a dict of stored results (see cfu.results) without running
+any statistics.
+"""
+
+import html
+import os
+import re
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+PAGE_TEMPLATE = 'page.html'
+TITLE = 'Colony-Forming Unit (CFU) Analysis Report'
+FORMATS = ('markdown', 'html')
+SIGNIFICANCE = 0.05
+TERMS = {'treatment': 'C(Treatment)', 'position': 'C(Position)', 'interaction': 'C(Treatment):C(Position)'}
+
+
+def load_template(name):
+    with open(os.path.join(TEMPLATE_DIR, name)) as f:
+        return f.read()
+
+
+def template_files(section):
+    """Paths of the templates a section can be rendered from."""
+    return sorted(os.path.join(TEMPLATE_DIR, name) for name in os.listdir(TEMPLATE_DIR)
+                  if name == f'{section}.md' or name.startswith(f'{section}_'))
+
+
+class Table:
+    """A DataFrame as a template field; the format spec lists the to_markdown options."""
+
+    def __init__(self, frame, fmt='markdown'):
+        self.frame = frame
+        self.fmt = fmt
+
+    def __format__(self, spec):
+        options = dict(option.partition('=')[::2] for option in spec.split(',') if option)
+        frame = self.frame.round(int(options['round'])) if 'round' in options else self.frame
+        index = 'index' in options
+        floatfmt = options.get('floatfmt', 'g')
+        if self.fmt == 'html':
+            table = frame.to_html(index=index, float_format=lambda x: format(x, floatfmt), border=0)
+            return ''.join(line.strip() for line in table.splitlines())
+        return f"```\n{frame.to_markdown(index=index, floatfmt=floatfmt)}\n```"
+
+
+def _term_tests(p):
+    """p-value and significance fields of the three terms, from p-values indexed by term."""
+    fields = {}
+    for key, term in TERMS.items():
+        fields[f'{key}_p'] = p[term]
+        fields[f'{key}_significance'] = 'significant' if p[term] < SIGNIFICANCE else 'not significant'
+    return fields
+
+
+def _overview(results):
+    return 'overview.md', {}
+
+
+def _summary(results):
+    efficacy = results['efficacy']
+    return 'summary.md', {
+        'summary': results['summary'],
+        'ci': efficacy['ci'],
+        'n_resamples': efficacy['n_resamples'],
+        'efficacy_by_position': efficacy['by_position'],
+        'efficacy_overall': efficacy['overall'],
+    }
+
+
+def _assumptions(results):
+    assumptions = results['assumptions']
+    equal_variance = assumptions['equal_variance']
+    return 'assumptions.md', {
+        'normality_results': assumptions['normality_results'],
+        'levene_stat': assumptions['levene_stat'],
+        'levene_p': assumptions['levene_p'],
+        'equal_variance': 'Met' if equal_variance else 'Not met',
+        'equal_variance_interpretation': (
+            'Since p > 0.05, the groups have similar variances, meeting this ANOVA assumption.' if equal_variance
+            else 'Since p < 0.05, the groups have different variances, violating this ANOVA assumption. Results '
+                 'should be interpreted with caution; the rank-based analysis below does not rely on this '
+                 'assumption.'),
+    }
+
+
+# What a significant / non-significant ANOVA term means
+ANOVA_MEANINGS = {
+    'treatment': ('This means that the different treatments do have significantly different effects on CFU counts.',
+                  'This means that we cannot conclude that the treatments have different effects on CFU counts.'),
+    'position': ('This means that the position on the slope significantly affects CFU counts.',
+                 'This means that the position on the slope does not significantly affect CFU counts.'),
+    'interaction': ('This means that the effect of treatments depends on the position on the slope. In other words, '
+                    'some treatments may work better at certain positions than others.',
+                    'This means that treatments have a consistent effect regardless of position on the slope.'),
+}
+
+
+def _anova(results):
+    anova_table = results['anova']
+    fields = _term_tests(anova_table['PR(>F)'])
+    for key, (significant, not_significant) in ANOVA_MEANINGS.items():
+        fields[f'{key}_significance'] = fields[f'{key}_significance'].capitalize()
+        fields[f'{key}_meaning'] = significant if fields[f'{key}_p'] < SIGNIFICANCE else not_significant
+    return 'anova.md', {'anova': anova_table, **fields}
+
+
+def _permutation(results):
+    permutation = results['permutation']
+    if isinstance(permutation, dict):
+        return 'permutation_skipped.md', {'reason': permutation['skipped']}
+    return 'permutation.md', {'permutation': permutation, **_term_tests(permutation['p-perm'])}
+
+
+def _nonparametric(results):
+    nonparametric = results['nonparametric']
+    if nonparametric is None:
+        return 'nonparametric_skipped.md', {}
+    art = nonparametric['art']
+    return 'nonparametric.md', {'art': art, 'kruskal': nonparametric['kruskal'], 'dunn': nonparametric['dunn'],
+                                **_term_tests(art['PR(>F)'])}
+
+
+def _count_model(results):
+    count_model = results['count_model']
+    overdispersed = count_model['dispersion'] > 1.5
+    return 'count_model.md', {
+        'dispersion': count_model['dispersion'],
+        'dispersion_interpretation': (
+            'well above 1, so the counts vary more than a Poisson model allows and the negative binomial tests '
+            'should be used.' if overdispersed
+            else 'close to 1, so the Poisson model describes the spread of the counts adequately.'),
+        'alpha': count_model['alpha'],
+        'negbin': count_model['negbin'],
+        'poisson': count_model['poisson'],
+        'ci': count_model['ci'],
+        'by_position': count_model['by_position'],
+        'overall': count_model['overall'],
+        **_term_tests(count_model['negbin']['PR(>Chi2)']),
+    }
+
+
+def _posthoc(results):
+    posthoc = results['posthoc']
+    return 'posthoc.md', {'treatment': posthoc['treatment'], 'position': posthoc['position'],
+                          'interaction': posthoc['interaction']}
+
+
+def _figures(results):
+    return 'figures.md', {'ci': results['efficacy']['ci']}
+
+
+def _conclusion(results):
+    anova_p = results['anova']['PR(>F)']
+    posthoc = results['posthoc']
+    nonparametric = results['nonparametric']
+
+    # Conclusion based on the actual results
+    findings = ''
+    for key, noun in (('treatment', 'treatment'), ('position', 'position')):
+        if anova_p[TERMS[key]] < SIGNIFICANCE:
+            pairs = posthoc[key][posthoc[key]['p-tukey'] < SIGNIFICANCE]
+            if pairs.empty:
+                findings += (f"Although the ANOVA indicates a significant {noun} effect, post-hoc tests did not "
+                             "identify specific pairs with significant differences. ")
+                continue
+            findings += ("The analysis reveals a significant effect of treatment on CFU counts. " if key == 'treatment'
+                         else "There is a significant effect of position on CFU counts. ")
+            for _, row in pairs.iterrows():
+                findings += f"The {row['A']} and {row['B']} {noun}s differ significantly (p = {row['p-tukey']:.4f}). "
+        elif key == 'treatment':
+            findings += "The analysis did not detect a significant effect of treatment on CFU counts. "
+        else:
+            findings += "The position on the slope did not significantly affect CFU counts. "
+    if anova_p[TERMS['interaction']] < SIGNIFICANCE:
+        findings += ("The significant interaction between treatment and position indicates that the effect of "
+                     "treatments varies depending on the position on the slope.")
+
+    rank_note = ''
+    if nonparametric is not None:
+        art_p = nonparametric['art']['PR(>F)']
+        terms = list(TERMS.values())
+        agree = all((art_p[term] < SIGNIFICANCE) == (anova_p[term] < SIGNIFICANCE) for term in terms)
+        rank_note = (f"\n\nBecause the ANOVA assumptions were not met, the treatment, position and interaction effects "
+                     f"were also tested on aligned ranks (p = {art_p[terms[0]]:.4f}, {art_p[terms[1]]:.4f} and "
+                     f"{art_p[terms[2]]:.4f}); "
+                     + ("the rank-based results agree with the ANOVA on every term at the 0.05 level." if agree else
+                        "at the 0.05 level they differ from the ANOVA on at least one term, so the rank-based "
+                        "results should be preferred."))
+
+    # Overall efficacy with its bootstrap interval
+    overall = results['efficacy']['overall'].set_index('Treatment')
+    fields = {'findings': findings, 'rank_note': rank_note, 'ci': results['efficacy']['ci']}
+    for key, treatment in (('botector', 'Botector'), ('bicarbonate', 'Potassium Bicarbonate')):
+        fields[key] = overall.loc[treatment, 'efficacy']
+        fields[f'{key}_low'] = overall.loc[treatment, 'ci_low']
+        fields[f'{key}_high'] = overall.loc[treatment, 'ci_high']
+    return 'conclusion.md', fields
+
+
+# Section -> (results it reads, context function), in report order
+SECTIONS = {
+    'overview': ((), _overview),
+    'summary': (('summary', 'efficacy'), _summary),
+    'assumptions': (('assumptions',), _assumptions),
+    'anova': (('anova',), _anova),
+    'permutation': (('permutation',), _permutation),
+    'nonparametric': (('nonparametric',), _nonparametric),
+    'count_model': (('count_model',), _count_model),
+    'posthoc': (('posthoc',), _posthoc),
+    'figures': (('efficacy',), _figures),
+    'conclusion': (('anova', 'posthoc', 'efficacy', 'nonparametric'), _conclusion),
+}
+
+INLINE = [
+    (re.compile(r'!\[([^\]]*)\]\(([^)\s]+)\)'), r'<img src="\2" alt="\1">'),
+    (re.compile(r'\*\*(.+?)\*\*'), r'<strong>\1</strong>'),
+    (re.compile(r'\*([^*\s][^*]*?)\*'), r'<em>\1</em>'),
+]
+
+
+def _inline(text):
+    text = html.escape(text, quote=False)
+    for pattern, replacement in INLINE:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def markdown_to_html(text):
+    """HTML for the markdown the templates use: headings, paragraphs, lists, bold, italics and images.
+
+    Lines that already hold an HTML table are passed through unchanged.
+    """
+    out, paragraph, items = [], [], []
+    list_tag = None
+
+    def flush():
+        if paragraph:
+            out.append(f"<p>{' '.join(paragraph)}</p>")
+            paragraph.clear()
+        if items:
+            out.append(f"<{list_tag}>{''.join(f'<li>{item}</li>' for item in items)}</{list_tag}>")
+            items.clear()
+
+    for line in text.split('\n'):
+        heading = re.match(r'(#{1,6}) (.*)', line)
+        item = re.match(r'(?:(-)|\d+\.) (.*)', line)
+        if line.startswith('<table'):
+            flush()
+            out.append(line)
+        elif not line.strip():
+            flush()
+        elif heading:
+            flush()
+            level = len(heading[1])
+            out.append(f'<h{level}>{_inline(heading[2])}</h{level}>')
+        elif item:
+            tag = 'ul' if item[1] else 'ol'
+            if paragraph or tag != list_tag:
+                flush()
+            list_tag = tag
+            items.append(_inline(item[2]))
+        else:
+            if items:
+                flush()
+            paragraph.append(_inline(line))
+    flush()
+    return '\n'.join(out)
+
+
+def render_section(name, results, fmt='markdown'):
+    """Text of one section in 'markdown' or 'html'; results maps stage names to values (at least the inputs)."""
+    template, fields = SECTIONS[name][1](results)
+    fields = {key: Table(value, fmt) if hasattr(value, 'to_markdown') else value for key, value in fields.items()}
+    text = load_template(template).format_map(fields).strip('\n')
+    return markdown_to_html(text) if fmt == 'html' else text
+
+
+def section_texts(name, results):
+    """One section in every format, as a dict keyed by format."""
+    return {fmt: render_section(name, results, fmt) for fmt in FORMATS}
+
+
+def join_sections(texts, fmt='markdown'):
+    """A whole report from its rendered sections, in report order."""
+    if fmt == 'html':
+        return load_template(PAGE_TEMPLATE).format(title=html.escape(TITLE), body='\n'.join(texts))
+    return '\n\n'.join(texts)
+
+
+def render_report(results, fmt='markdown'):
+    """The whole report from a dict of results keyed by stage name."""
+    return join_sections([render_section(name, results, fmt) for name in SECTIONS], fmt)
+
+
+def write_report(sections, path='cfu_analysis_report.md', html_path=None):
+    """Write the markdown (and, with html_path, the HTML) report from section_texts in report order.
+
+    Returns the paths written.
+    """
+    paths = [(path, 'markdown')] + ([(html_path, 'html')] if html_path else [])
+    for out_path, fmt in paths:
+        with open(out_path, 'w') as f:
+            f.write(join_sections([texts[fmt] for texts in sections], fmt))
+    return [out_path for out_path, _ in paths]
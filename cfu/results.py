@@ -0,0 +1,228 @@
+"""Columnar store of every computed result, for dashboards and report rendering.
+
+The value of each statistics stage (a table, a dict of tables and numbers,
+or None) is one entry of the store. Every table column is saved as its own
+.npy file, which np.load can memory-map, and a single index.json records
+for each entry its tables (columns, dtypes, index levels, row count), its
+scalar values and a digest of its content. Entries whose digest did not
+change are not rewritten. Each entry lives in a directory named after its
+digest and the index is replaced atomically, so readers never see a
+half-written entry.
+
+    store = ResultsStore('cfu_results')
+    store.table('anova')                        # DataFrame
+    store.column('summary', 'table', 'mean')    # memory-mapped array
+    collect(['a/cfu_results', 'b/cfu_results'], 'efficacy', 'overall')
+
+Reports can be rendered from a store alone (python -m cfu render), so
+results are served without recomputing anything.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+RESULTS_DIR = 'cfu_results'
+INDEX_FILE = 'index.json'
+FORMAT_VERSION = 1
+
+
+def _scalar(value):
+    """JSON record of a scalar result, keeping its type (NaN is stored as null)."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return {'type': 'bool', 'value': value}
+    if isinstance(value, int):
+        return {'type': 'int', 'value': value}
+    if isinstance(value, float):
+        return {'type': 'float', 'value': None if np.isnan(value) else value}
+    return {'type': 'str', 'value': str(value)}
+
+
+def _unscalar(record):
+    if record['type'] == 'float' and record['value'] is None:
+        return float('nan')
+    return record['value']
+
+
+def _encode(series):
+    """Array to store for a column and the metadata needed to restore its dtype."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), {'dtype': 'category', 'categories': dtype.categories.tolist()}
+    if dtype.kind in 'biuf':
+        return series.to_numpy(), {'dtype': str(dtype)}
+    return series.to_numpy(dtype=str), {'dtype': str(dtype)}
+
+
+def _decode(array, meta):
+    if meta['dtype'] == 'category':
+        return pd.Categorical.from_codes(array, meta['categories'])
+    if meta['dtype'] == str(array.dtype):
+        return array
+    return pd.Series(array).astype(meta['dtype']).array
+
+
+def _columns(frame):
+    """(index levels, columns) of a frame, each a list of (name, Series); a default RangeIndex is not stored."""
+    index = []
+    if not frame.index.equals(pd.RangeIndex(len(frame))):
+        index = [(name, pd.Series(frame.index.get_level_values(level)))
+                 for level, name in enumerate(frame.index.names)]
+    return index, [(name, frame[name]) for name in frame.columns]
+
+
+def _flatten(value):
+    """(kind, tables, scalars, key order) of a stage value."""
+    if value is None:
+        return 'none', {}, {}, []
+    if isinstance(value, pd.DataFrame):
+        return 'table', {'table': value}, {}, ['table']
+    tables = {key: item for key, item in value.items() if isinstance(item, pd.DataFrame)}
+    scalars = {key: _scalar(item) for key, item in value.items() if key not in tables}
+    return 'dict', tables, scalars, list(value)
+
+
+def _read_index(root):
+    try:
+        with open(os.path.join(root, INDEX_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_entry(root, name, value, previous=None):
+    """Write one entry's columns (unless an identical copy exists); returns its index record."""
+    kind, tables, scalars, keys = _flatten(value)
+    digest = hashlib.sha256()
+    record = {'kind': kind, 'keys': keys, 'values': scalars, 'tables': {}}
+    arrays = []
+    for key, frame in tables.items():
+        index, columns = _columns(frame)
+        table = record['tables'][key] = {'rows': len(frame), 'index': [], 'columns': []}
+        for part, items in (('index', index), ('columns', columns)):
+            for col_name, series in items:
+                array, meta = _encode(series)
+                meta.update(name=col_name, file=f'{key}.{len(arrays)}.npy')
+                table[part].append(meta)
+                arrays.append((meta['file'], array))
+                digest.update(f'{meta["file"]}:{array.dtype.str}:'.encode())
+                digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(json.dumps(record, sort_keys=True, default=str).encode())
+    record['digest'] = digest.hexdigest()
+    record['dir'] = f'{name}-{record["digest"][:16]}'
+
+    path = os.path.join(root, record['dir'])
+    if previous and previous.get('digest') == record['digest'] and os.path.isdir(path):
+        return record
+    if not os.path.isdir(path):
+        tmp = f'{path}.{os.getpid()}.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for file_name, array in arrays:
+            np.save(os.path.join(tmp, file_name), array, allow_pickle=False)
+        os.replace(tmp, path)
+    return record
+
+
+def write_results(root, results):
+    """Store a dict of stage values under root; returns the path of the index."""
+    os.makedirs(root, exist_ok=True)
+    previous = _read_index(root).get('entries', {})
+    entries = {name: _write_entry(root, name, value, previous.get(name)) for name, value in results.items()}
+    index_path = os.path.join(root, INDEX_FILE)
+    tmp = f'{index_path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'version': FORMAT_VERSION, 'entries': entries}, f, indent=2, allow_nan=False)
+    os.replace(tmp, index_path)
+
+    # Entry directories the new index no longer refers to
+    current = {entry['dir'] for entry in entries.values()}
+    for name in os.listdir(root):
+        if os.path.isdir(os.path.join(root, name)) and name not in current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return index_path
+
+
+class ResultsStore:
+    """Read access to a results directory written by write_results."""
+
+    def __init__(self, root=RESULTS_DIR):
+        self.root = root
+        self.index = _read_index(root)
+        if not self.index:
+            raise FileNotFoundError(f'no results index in {root}')
+
+    @property
+    def entries(self):
+        return list(self.index['entries'])
+
+    def _entry(self, entry):
+        return self.index['entries'][entry]
+
+    def column(self, entry, key, name, mmap=True):
+        """One stored column as saved (category columns as their codes), memory-mapped by default."""
+        record = self._entry(entry)
+        meta = next(meta for meta in record['tables'][key]['columns'] if meta['name'] == name)
+        return np.load(os.path.join(self.root, record['dir'], meta['file']), mmap_mode='r' if mmap else None)
+
+    def table(self, entry, key='table'):
+        """A stored table as a DataFrame with its original dtypes and index."""
+        record = self._entry(entry)
+        table = record['tables'][key]
+
+        def load(meta):
+            return _decode(np.load(os.path.join(self.root, record['dir'], meta['file'])), meta)
+
+        frame = pd.DataFrame({meta['name']: load(meta) for meta in table['columns']})
+        if not table['columns']:
+            frame = pd.DataFrame(index=pd.RangeIndex(table['rows']))
+        if table['index']:
+            levels = [pd.Index(load(meta), name=meta['name']) for meta in table['index']]
+            frame.index = levels[0] if len(levels) == 1 else pd.MultiIndex.from_arrays(levels)
+        return frame
+
+    def value(self, entry, key):
+        """A stored scalar result."""
+        return _unscalar(self._entry(entry)['values'][key])
+
+    def load(self, entry):
+        """An entry as the stage value it was stored from (a DataFrame, a dict or None)."""
+        record = self._entry(entry)
+        if record['kind'] == 'none':
+            return None
+        if record['kind'] == 'table':
+            return self.table(entry)
+        return {key: self.table(entry, key) if key in record['tables'] else self.value(entry, key)
+                for key in record['keys']}
+
+    def load_all(self):
+        return {entry: self.load(entry) for entry in self.entries}
+
+
+def experiment_label(root):
+    """Name of the experiment a results directory belongs to (its parent directory for cfu_results)."""
+    root = os.path.normpath(root)
+    if os.path.basename(root) == RESULTS_DIR:
+        root = os.path.dirname(root) or '.'
+    return os.path.basename(os.path.abspath(root))
+
+
+def collect(roots, entry, key='table', label='experiment'):
+    """One stored table from many results directories, stacked with a column naming the experiment.
+
+    A stored index (the term names of an ANOVA table, say) becomes columns.
+    """
+    frames = []
+    for root in roots:
+        store = ResultsStore(root)
+        frame = store.table(entry, key)
+        if store.index['entries'][entry]['tables'][key]['index']:
+            frame = frame.reset_index()
+        frames.append(frame.assign(**{label: experiment_label(root)}))
+    return pd.concat(frames, ignore_index=True)
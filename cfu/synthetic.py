@@ -0,0 +1,122 @@
+"""Synthetic plate-count exports in the format of the thesis CSV.
+
+Counts are negative-binomial (a gamma-Poisson mixture) around a cell mean
+built multiplicatively from a base count, a treatment effect, a position
+effect and optional interaction noise, with a lognormal random effect per
+replicate. The sample IDs, plate columns and 'average' column match what
+load_plate_counts reads; extra treatments and positions get generated
+codes, and label_maps returns the maps the loader needs for them.
+
+    python -m cfu.synthetic big.csv --replicates 300 --plates 5
+"""
+
+import argparse
+import string
+
+import numpy as np
+import pandas as pd
+
+from cfu.loader import POSITION_MAP, TREATMENT_MAP
+
+BASE_COUNT = 210.0
+# Multiplicative effects relative to the first level, close to the thesis data
+TREATMENT_EFFECTS = (1.0, 0.57, 0.37)
+POSITION_EFFECTS = (1.0, 1.1, 0.8)
+REPLICATE_SD = 0.15  # SD of the log replicate effect
+DISPERSION = 8.0  # negative-binomial size k; variance = mu + mu^2 / k
+
+
+def label_maps(n_treatments=3, n_positions=3):
+    """(position_map, treatment_map) for a design; the first three levels use the thesis codes."""
+    position_codes = list(POSITION_MAP) + [c for c in string.ascii_uppercase if c not in POSITION_MAP]
+    if n_positions > len(position_codes):
+        raise ValueError(f'at most {len(position_codes)} positions fit single-letter position codes')
+    position_map = {code: POSITION_MAP.get(code, f'Position {code}') for code in position_codes[:n_positions]}
+    treatment_map = dict(list(TREATMENT_MAP.items())[:n_treatments])
+    for i in range(len(treatment_map), n_treatments):
+        code = 'tr' + ''.join(string.ascii_lowercase[int(d)] for d in str(i))
+        treatment_map[code] = f'Treatment {i + 1}'
+    return position_map, treatment_map
+
+
+def _effects(effects, n, default):
+    effects = default if effects is None else effects
+    effects = np.asarray(effects, dtype=float)
+    if len(effects) >= n:
+        return effects[:n]
+    # Extra levels repeat the given effects cyclically
+    return np.resize(effects, n)
+
+
+def cell_means(n_treatments=3, n_positions=3, base=BASE_COUNT, treatment_effects=None,
+               position_effects=None, interaction_sd=0.0, rng=None):
+    """Expected count of every Treatment x Position cell, shape (n_treatments, n_positions)."""
+    rng = np.random.default_rng(rng)
+    t = _effects(treatment_effects, n_treatments, TREATMENT_EFFECTS)
+    p = _effects(position_effects, n_positions, POSITION_EFFECTS)
+    interaction = np.exp(rng.normal(0, interaction_sd, (n_treatments, n_positions))) if interaction_sd else 1.0
+    return base * t[:, None] * p[None, :] * interaction
+
+
+def generate_counts(n_treatments=3, n_positions=3, n_replicates=3, n_plates=5, base=BASE_COUNT,
+                    treatment_effects=None, position_effects=None, interaction_sd=0.0,
+                    replicate_sd=REPLICATE_SD, dispersion=DISPERSION, seed=0):
+    """Wide plate-count table (one row per sample, plate columns '1'..n and 'average').
+
+    dispersion=None draws Poisson counts (no overdispersion).
+    """
+    rng = np.random.default_rng(seed)
+    position_map, treatment_map = label_maps(n_treatments, n_positions)
+    mu = cell_means(n_treatments, n_positions, base, treatment_effects, position_effects,
+                    interaction_sd, rng)
+    mu = mu[:, :, None] * np.exp(rng.normal(0, replicate_sd, (n_treatments, n_positions, n_replicates)))
+    mu = np.broadcast_to(mu[..., None], mu.shape + (n_plates,))
+    if dispersion is None:
+        counts = rng.poisson(mu)
+    else:
+        counts = rng.poisson(rng.gamma(dispersion, mu / dispersion))
+
+    # Rows grouped like the thesis file: treatment, then position, then replicate
+    t, p, r = np.meshgrid(np.arange(n_treatments), np.arange(n_positions), np.arange(n_replicates),
+                          indexing='ij')
+    ids = (np.asarray(list(position_map))[p.ravel()].astype(object)
+           + np.asarray(list(treatment_map))[t.ravel()].astype(object)
+           + (r.ravel() + 1).astype(str).astype(object))
+    wide = pd.DataFrame(counts.reshape(-1, n_plates), index=ids,
+                        columns=[str(i + 1) for i in range(n_plates)])
+    wide['average'] = wide.mean(axis=1).round(2)
+    return wide
+
+
+def write_csv(wide, path):
+    """Write a generated table like the plate-reader export (blank header over the IDs)."""
+    wide.to_csv(path, index_label='')
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic plate-count CSV.')
+    parser.add_argument('path', help='output CSV')
+    parser.add_argument('--treatments', type=int, default=3)
+    parser.add_argument('--positions', type=int, default=3)
+    parser.add_argument('--replicates', type=int, default=3)
+    parser.add_argument('--plates', type=int, default=5)
+    parser.add_argument('--base', type=float, default=BASE_COUNT, help='mean count of the first cell')
+    parser.add_argument('--treatment-effects', type=float, nargs='+', help='multiplicative, first level 1')
+    parser.add_argument('--position-effects', type=float, nargs='+', help='multiplicative, first level 1')
+    parser.add_argument('--interaction-sd', type=float, default=0.0, help='SD of log interaction noise')
+    parser.add_argument('--replicate-sd', type=float, default=REPLICATE_SD)
+    parser.add_argument('--dispersion', type=float, default=DISPERSION,
+                        help='negative-binomial k (0 for Poisson counts)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    wide = generate_counts(args.treatments, args.positions, args.replicates, args.plates, args.base,
+                           args.treatment_effects, args.position_effects, args.interaction_sd,
+                           args.replicate_sd, args.dispersion or None, args.seed)
+    write_csv(wide, args.path)
+    print(f"{len(wide)} samples x {args.plates} plates written to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
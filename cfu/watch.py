@@ -0,0 +1,154 @@
+"""Watch mode: keep the analysis libraries loaded and rebuild whenever the data changes.
+
+The watcher polls the modification time and size of a CSV (or of every
+*.csv in a directory, laid out per experiment like the batch command).
+After a change it waits until the file has been quiet for the debounce
+interval, so a spreadsheet that saves in several writes is analysed once,
+then brings that experiment's outputs up to date through the artifact
+cache. The tidy frame is a content cutoff (see cfu.cache): an edit that
+leaves the plate counts as they were (a retyped average, reformatting) reruns
+nothing below it, while any change to a count reruns every statistics stage,
+since each of them reads the whole frame. Figures and report sections whose
+inputs did not change are not redrawn. The report does not wait for the figures, which take most
+of the time; stale figures render in a process pool that stays up between
+rebuilds with matplotlib and seaborn already imported.
+
+A file that fails to load (for instance half-way through an edit) is
+reported and the previous outputs are left in place until the next change.
+Polling needs only the standard library and behaves the same on network
+drives, where change notifications are unreliable.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cfu.batch import experiment_names, find_experiments
+from cfu.cache import CACHE_DIR, ArtifactCache
+from cfu.pipeline import FIGURE_FILES, build_stages, build_targets
+
+POLL_SECONDS = 0.5
+DEBOUNCE_SECONDS = 1.0
+
+
+def preload():
+    """Import everything the stages and figures use, so no rebuild waits for imports."""
+    # statsmodels is only needed for unbalanced data, which is the norm while plates are being entered
+    import statsmodels.formula.api  # noqa: F401
+
+    import cfu.anova  # noqa: F401
+    import cfu.assumptions  # noqa: F401
+    import cfu.bootstrap  # noqa: F401
+    import cfu.cube  # noqa: F401
+    import cfu.glm  # noqa: F401
+    import cfu.loader  # noqa: F401
+    import cfu.nonparametric  # noqa: F401
+    import cfu.permutation  # noqa: F401
+    import cfu.plots  # noqa: F401
+    import cfu.posthoc  # noqa: F401
+    import cfu.report  # noqa: F401
+    import cfu.results  # noqa: F401
+
+
+def snapshot(paths):
+    """(mtime_ns, size) of each path, or None for a file that is missing."""
+    state = {}
+    for path in paths:
+        try:
+            info = os.stat(path)
+        except OSError:
+            state[path] = None
+        else:
+            state[path] = (info.st_mtime_ns, info.st_size)
+    return state
+
+
+class Watcher:
+    """Keeps the outputs of one CSV, or of every CSV in a directory, in step with the data.
+
+    stage_options are passed on to build_stages (dpi, n_resamples, seed, ...).
+    With cache_dir=None nothing is persisted, but unchanged stages are still
+    skipped for as long as the watcher runs.
+    """
+
+    def __init__(self, target, outdir='.', cache_dir=CACHE_DIR, workers=None, profiler=None,
+                 log=print, **stage_options):
+        self.target = target
+        self.outdir = outdir
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.profiler = profiler
+        self.log = log
+        self.stage_options = stage_options
+        self.caches = {}
+        preload()
+        self.pool = None
+        if workers != 1:
+            self.pool = ProcessPoolExecutor(max_workers=workers or min(len(FIGURE_FILES), os.cpu_count() or 1),
+                                            initializer=preload)
+
+    def paths(self):
+        """The CSVs being watched (re-listed on every poll for a directory)."""
+        if os.path.isdir(self.target):
+            return find_experiments([self.target])
+        return [self.target]
+
+    def layout(self, csv_path):
+        """(output directory, cache directory) of an experiment."""
+        if not os.path.isdir(self.target):
+            return self.outdir, self.cache_dir
+        paths = self.paths()
+        name = experiment_names(paths)[paths.index(csv_path)]
+        outdir = os.path.join(self.outdir, name)
+        return outdir, os.path.join(outdir, '.cfu_cache') if self.cache_dir else None
+
+    def rebuild(self, csv_path):
+        """Bring one experiment up to date; returns (regenerated paths, names of recomputed stages)."""
+        outdir, cache_dir = self.layout(csv_path)
+        os.makedirs(outdir, exist_ok=True)
+        if (outdir, cache_dir) not in self.caches:
+            self.caches[outdir, cache_dir] = ArtifactCache(cache_dir, profiler=self.profiler)
+        stages = build_stages(csv_path, outdir, self.caches[outdir, cache_dir], workers=self.workers,
+                              pool=self.pool, **self.stage_options)
+        paths = build_targets(stages, ['report'], self.workers, self.pool)
+        return paths, [name for name, artifact in stages.items() if artifact.recomputed and not artifact.outputs]
+
+    def update(self, csv_path):
+        """Rebuild one experiment and log the outcome; errors are logged, not raised."""
+        start = time.perf_counter()
+        stamp = time.strftime('%H:%M:%S')
+        try:
+            paths, recomputed = self.rebuild(csv_path)
+        except Exception as exc:
+            self.log(f"{stamp} {csv_path}: {type(exc).__name__}: {exc} (previous outputs kept)")
+            return False
+        detail = f"reran {', '.join(recomputed)}" if recomputed else 'no stage changed'
+        self.log(f"{stamp} {csv_path}: {len(paths)} outputs regenerated in "
+                 f"{time.perf_counter() - start:.2f} s ({detail})")
+        return True
+
+    def run(self, poll=POLL_SECONDS, debounce=DEBOUNCE_SECONDS):
+        """Poll until interrupted, rebuilding each CSV once it has been quiet for debounce seconds."""
+        seen = snapshot(self.paths())
+        for path, state in seen.items():
+            if state is not None:
+                self.update(path)
+        pending = {}  # path -> when its latest change was seen
+        while True:
+            time.sleep(poll)
+            current = snapshot(self.paths())
+            now = time.monotonic()
+            for path, state in current.items():
+                if state != seen.get(path):
+                    pending[path] = now
+            seen = current
+            for path, changed in sorted(pending.items()):
+                if seen.get(path) is None:
+                    del pending[path]
+                elif now - changed >= debounce:
+                    del pending[path]
+                    self.update(path)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)